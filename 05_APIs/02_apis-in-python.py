@@ -286,6 +286,25 @@ print(data)
 
 len(all_docs)
 
+# Notice that the loop never checks whether the request worked. If the API answers with
+# a 429 ("too many requests") or a 5xx server error, `data['response']` fails and the
+# whole loop crashes -- or worse, the error message gets stored as if it were data.
+# The `nyt` folder next to this script contains a sturdier version of the same loop.
+# It checks every response, waits longer after each failure (exponential backoff),
+# respects the `Retry-After` header, and retries failed pages at the end of the run.
+
+from nyt import NYTClient
+
+client = NYTClient(key)
+all_docs = client.collect("impeachment+trump", "20200301", "20200302")
+
+# Any pages that still failed after all retries end up here
+client.retry_queue
+
+# The client also counts what it did: requests, retries, 429s, bytes, docs per second...
+client.metrics.to_dict()
+print(client.metrics.to_json())
+
 # In[ ]:
 
 # ## 4. Make a function
@@ -310,6 +329,62 @@ def apisearch(q, begin, end, key, pg):
 # Now, try testing the function... 
 apisearch(q="Clinton", begin="20200101", end="20200307", pg="1", key=key)
 
+# This version only prints the URL. A more useful apisearch() would hand back the
+# documents, one page at a time, so we can process each page as it arrives. The
+# version in nyt/search.py does that: it returns an *iterator*, and while you are
+# working on one page it is already requesting the next ones in the background
+# (at most `prefetch` pages ahead).
+
+from nyt.search import apisearch
+
+all_docs = []
+for docs in apisearch(q="Clinton", begin="20200101", end="20200307", key=key, prefetch=2):
+    print("got " + str(len(docs)) + " docs")
+    all_docs.extend(docs)
+
+# If you have many search terms, don't run them one after the other. collect_batch()
+# shares one rate limit between all of them and takes pages from each search in turn,
+# writing every search to its own file in the output folder.
+
+from nyt import collect_batch
+
+summary = collect_batch(client,
+                        [("Clinton", "20200101", "20200307"),
+                         ("impeachment+trump", "20200201", "20200229")],
+                        "data_raw/batch")
+summary
+
+# Before a big collection, find out how big it is. plan_collection() requests only the
+# first page of each search (splitting date ranges that have more than 100 pages) and
+# estimates the number of requests, days of quota and hours it will take.
+
+from nyt import plan_collection, run_plan
+
+plan = plan_collection(client, [("impeachment+trump", "20190901", "20200229")])
+plan.estimate()
+plan.save("data_raw/plan.json")
+
+# If the estimate looks reasonable, run exactly that plan
+run_plan(client, plan, "data_raw/batch")
+
+# A collection too big for one process (or one computer) can go into a shared work
+# queue instead: a SQLite file of tasks. Every worker takes a task, fetches the page,
+# saves it to its own archive folder and marks the task done, and the rate limit of
+# each key is shared through the same file, so more workers never means too many
+# requests.
+
+from nyt import WorkQueue, run_worker, shared_key_pool
+
+queue = WorkQueue("data_raw/queue.db")
+queue.add_plan(plan) # or queue.add_window("impeachment+trump", "20200101", "20200131")
+
+worker_client = NYTClient(shared_key_pool("data_raw/queue.db", [key]))
+run_worker(queue, worker_client, "data_raw/archive")
+queue.counts()
+
+# To add more workers, run this in as many terminals as you like (from the 05_APIs folder):
+#   python -m nyt.workqueue work data_raw/queue.db data_raw/archive --keys YOUR_KEY
+
 
 # In[ ]:
 
@@ -346,14 +421,38 @@ all_formatted = format_articles(all_docs)
 # And look at the result
 all_formatted[:5]
 
-# Now, let's export the data to a CSV.
-import csv
-keys = all_formatted[0].keys()
-with open('data_raw/article_API.csv', 'w') as output_file:
-    dict_writer = csv.DictWriter(output_file, keys)
-    dict_writer.writeheader()
-    dict_writer.writerows(all_formatted)
+# Now, let's export the data to a CSV. You could open the file and use `csv.DictWriter`,
+# but then nothing is written until everything has been collected. ArticleWriter
+# writes the articles in batches as they come in (here every 1000 rows), with fixed
+# columns `id`, `headline` and `date`. Use fmt="parquet" for a Parquet file instead.
+from nyt import ArticleWriter
+
+with ArticleWriter('data_raw/article_API.csv', batch_size=1000) as writer:
+    writer.writerows(all_formatted)
+
+# Because it writes in batches, it can sit at the end of the collection loop directly,
+# so a crash late in a long run only loses the last few pages:
+with ArticleWriter('data_raw/article_API.csv') as writer:
+    for docs in apisearch(q="impeachment+trump", begin="20200301", end="20200302", key=key):
+        writer.writerows(format_articles(docs))
     
+# It is good practice to keep the raw responses too, so you can re-run the formatting
+# later (e.g. after adding fields in the challenge below) without calling the API again.
+# A ResponseArchive stores every response in a few compressed files. Give it to the
+# client and pages that are already archived are read from disk instead of the API.
+
+from nyt import ResponseArchive, format_archive
+
+archive = ResponseArchive("data_raw/nyt_archive")
+client = NYTClient(key, archive=archive)
+all_docs = client.collect("impeachment+trump", "20200301", "20200302")
+
+# Read back a single page...
+archive.get("impeachment+trump", "20200301-20200302", 0)
+
+# ...or re-run format_articles over everything in the archive
+all_formatted = list(format_archive(archive, format_articles))
+
 # In[ ]:
 
 # ## Challenge, Part A: Add caption and one or two other fields to the format_articles() function 
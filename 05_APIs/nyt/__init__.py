@@ -0,0 +1,19 @@
+# coding: utf-8
+
+'''
+Helpers for collecting articles from the NYT Article Search API.
+
+The lecture code in 02_apis-in-python.py walks through the API by hand. The
+modules in this folder wrap the same steps so longer collections can run
+unattended. Run your scripts from the 05_APIs folder so `import nyt` works.
+'''
+
+from nyt.archive import ResponseArchive, format_archive
+from nyt.batch import BatchCollector, Search, collect_batch
+from nyt.export import ArticleWriter, write_articles
+from nyt.client import (APIError, CircuitBreaker, KeyPool, NYTClient,
+                        RateLimiter)
+from nyt.metrics import Metrics
+from nyt.planner import Plan, plan_collection, run_plan
+from nyt.search import apisearch
+from nyt.workqueue import WorkQueue, run_worker, shared_key_pool
@@ -0,0 +1,206 @@
+# coding: utf-8
+
+'''
+Compressed archive of raw API responses.
+
+Keeping the raw JSON makes a collection reproducible, but one pretty-printed
+file per page wastes disk space and inodes. ResponseArchive appends responses
+to a few compressed JSONL segment files instead and keeps a sidecar index from
+(query, window, page) to the byte offset of each response, so any page can be
+read back without decompressing the rest of the archive.
+
+Each response is written as its own gzip member (or zstd frame). Concatenated
+members are still one valid .gz file, so a segment can also be streamed from
+start to end with the ordinary gzip module. A segment's extension says how it
+is compressed, so an archive can hold gzip and zstd segments side by side.
+'''
+
+import gzip
+import io
+import json
+import os
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+INDEX_NAME = "index.jsonl"
+
+# start a new segment once the current one passes this size
+SEGMENT_BYTES = 64 * 1024 * 1024
+
+EXTENSIONS = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+
+def window_key(begin, end):
+    '''Names a date window, e.g. "20200301-20200302".'''
+    return "%s-%s" % (begin, end)
+
+
+def compression_of(segment):
+    '''The compression of a segment file, from its extension.'''
+    for compression, extension in EXTENSIONS.items():
+        if segment.endswith(extension):
+            return compression
+    raise ValueError("unknown segment type: %s" % segment)
+
+
+def _compress(raw, compression):
+    if compression == "zstd":
+        return zstandard.ZstdCompressor().compress(raw)
+    return gzip.compress(raw)
+
+
+def _decompress(blob, compression):
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd archives need `pip install zstandard`")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return gzip.decompress(blob)
+
+
+def _open_stream(path, compression):
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd archives need `pip install zstandard`")
+        f = open(path, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            f, read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return gzip.open(path, "rt", encoding="utf-8")
+
+
+class ResponseArchive(object):
+    '''
+    Append-only archive of API responses in `directory`.
+
+    append() stores a response, get() reads one back by (query, window, page),
+    and records() / docs() stream the whole archive in the order it was
+    written. `compression` is "gzip" (default) or "zstd", which needs the
+    zstandard package. It only applies to new segments: reopening an archive
+    with a different compression starts a new segment, and older segments
+    are still read with their own.
+    '''
+    def __init__(self, directory, compression="gzip",
+                 segment_bytes=SEGMENT_BYTES):
+        if compression not in EXTENSIONS:
+            raise ValueError("compression must be 'gzip' or 'zstd'")
+        if compression == "zstd" and zstandard is None:
+            raise ImportError("zstd archives need `pip install zstandard`")
+        self.directory = directory
+        self.compression = compression
+        self.segment_bytes = segment_bytes
+        self.index = {}
+        self.segments = []
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._load_index()
+
+    def _load_index(self):
+        path = os.path.join(self.directory, INDEX_NAME)
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                key = (entry["query"], entry["window"], entry["page"])
+                self.index[key] = entry
+                if entry["segment"] not in self.segments:
+                    self.segments.append(entry["segment"])
+
+    def _current_segment(self, size):
+        # reuse the newest segment until it is full, if it is compressed the
+        # same way; frames of two kinds in one file could not be streamed
+        if self.segments and \
+                compression_of(self.segments[-1]) == self.compression:
+            name = self.segments[-1]
+            path = os.path.join(self.directory, name)
+            if os.path.getsize(path) + size <= self.segment_bytes:
+                return name
+        name = "segment-%05d%s" % (len(self.segments),
+                                   EXTENSIONS[self.compression])
+        self.segments.append(name)
+        return name
+
+    def __contains__(self, key):
+        return tuple(key) in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def append(self, query, window, page, data):
+        '''
+        Stores one response. `data` is the parsed JSON returned by the API.
+        Appending the same (query, window, page) again replaces the entry in
+        the index; the old bytes stay in the segment.
+        '''
+        record = {"query": query, "window": window, "page": page,
+                  "data": data}
+        raw = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        blob = _compress(raw, self.compression)
+        with self._lock:
+            name = self._current_segment(len(blob))
+            path = os.path.join(self.directory, name)
+            with open(path, "ab") as f:
+                offset = f.tell()
+                f.write(blob)
+            entry = {"query": query, "window": window, "page": page,
+                     "segment": name, "offset": offset, "length": len(blob)}
+            # the segment is written before the index line, so an index entry
+            # never points at bytes that are not on disk
+            with open(os.path.join(self.directory, INDEX_NAME), "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            self.index[(query, window, page)] = entry
+
+    def get(self, query, window, page):
+        '''
+        Reads back one response with a single seek. Raises KeyError if the
+        page is not in the archive.
+        '''
+        entry = self.index[(query, window, page)]
+        with open(os.path.join(self.directory, entry["segment"]), "rb") as f:
+            f.seek(entry["offset"])
+            blob = f.read(entry["length"])
+        return json.loads(_decompress(
+            blob, compression_of(entry["segment"])))["data"]
+
+    def records(self):
+        '''
+        Streams every record, segment by segment, without loading a whole
+        segment into memory. Pages that were appended twice appear twice.
+        '''
+        for name in self.segments:
+            path = os.path.join(self.directory, name)
+            with _open_stream(path, compression_of(name)) as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+    def docs(self):
+        '''Streams the docs of every archived page.'''
+        for record in self.records():
+            for doc in record["data"]["response"]["docs"]:
+                yield doc
+
+
+def format_archive(archive, format_articles, batch_size=1000):
+    '''
+    Runs `format_articles` (the function from the lecture) over the whole
+    archive in one streaming pass, `batch_size` docs at a time, and yields
+    the formatted articles.
+    '''
+    batch = []
+    for doc in archive.docs():
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            for article in format_articles(batch):
+                yield article
+            batch = []
+    if batch:
+        for article in format_articles(batch):
+            yield article
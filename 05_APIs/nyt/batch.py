@@ -0,0 +1,177 @@
+# coding: utf-8
+
+'''
+Collect many searches at once under one rate budget.
+
+Running one script per search term means each run idles through its own
+sleeps while the daily quota sits unused, and one huge search has to finish
+before the next one starts. BatchCollector puts the page requests of every
+search into a shared work queue and hands them out round-robin: each search
+gets one page in turn, so a search with 500 pages cannot starve a search
+with 5. All workers share the client's RateLimiter, which is the global
+budget.
+'''
+
+import collections
+import json
+import math
+import os
+import re
+import threading
+
+from nyt.client import PAGE_SIZE, APIError
+
+
+def slugify(text):
+    '''Turns a search into a safe file name, e.g. "impeachment_trump".'''
+    return re.sub(r"[^A-Za-z0-9]+", "_", text).strip("_") or "query"
+
+
+class Search(object):
+    '''
+    One search: a query and a date range, plus its progress. If `pages` is
+    already known (e.g. from a plan) all pages are queued right away.
+    '''
+    def __init__(self, q, begin, end, name=None, pages=None):
+        self.q = q
+        self.begin = begin
+        self.end = end
+        self.name = name or slugify("%s_%s_%s" % (q, begin, end))
+        self.hits = None
+        self.pages = pages
+        self.docs = 0
+        self.failed = []
+        self.errors = {}
+
+    def params(self, page):
+        return {"q": self.q, "begin_date": self.begin,
+                "end_date": self.end, "page": page}
+
+    def summary(self):
+        return {"q": self.q, "begin": self.begin, "end": self.end,
+                "hits": self.hits, "pages": self.pages, "docs": self.docs,
+                "failed": [p["page"] for p in self.failed],
+                "errors": dict(self.errors)}
+
+
+class BatchCollector(object):
+    '''
+    Runs a batch of searches with `workers` threads sharing one NYTClient.
+
+    Each search's docs are written, one JSON object per line, to
+    `<output_dir>/<search name>.jsonl` as its pages arrive.
+    '''
+    def __init__(self, client, output_dir, workers=2):
+        self.client = client
+        self.output_dir = output_dir
+        self.workers = workers
+        self._cond = threading.Condition()
+        self._queues = collections.OrderedDict()
+        self._turns = collections.deque()
+        self._in_flight = 0
+        self._files = {}
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+    def _next_task(self):
+        # round-robin over the searches that have pages waiting
+        with self._cond:
+            while True:
+                for _ in range(len(self._turns)):
+                    name = self._turns[0]
+                    self._turns.rotate(-1)
+                    if self._queues[name]:
+                        self._in_flight += 1
+                        return self._queues[name].popleft()
+                if self._in_flight == 0:
+                    return None
+                # nothing to do until a first page reveals more pages
+                self._cond.wait()
+
+    def _task_done(self, search, page, hits):
+        with self._cond:
+            try:
+                if page == 0 and hits is not None:
+                    search.hits = hits
+                    if search.pages is None:
+                        search.pages = int(math.ceil(hits /
+                                                     float(PAGE_SIZE)))
+                        self._queues[search.name].extend(
+                            (search, i) for i in range(1, search.pages))
+            finally:
+                # or the other workers wait for this task forever
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def _write(self, search, docs):
+        f, lock = self._files[search.name]
+        lines = "".join(json.dumps(doc) + "\n" for doc in docs)
+        with lock:
+            f.write(lines)
+            f.flush()
+            search.docs += len(docs)
+
+    def _work(self):
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            search, page = task
+            params = search.params(page)
+            hits = None
+            try:
+                data = self.client.fetch_page(params)
+                if page == 0:
+                    hits = data["response"]["meta"]["hits"]
+                self._write(search, data["response"]["docs"])
+            except Exception as e:
+                # not only API errors: a full disk or an odd response must
+                # not end this worker and leave the page unaccounted for
+                with self._cond:
+                    search.failed.append(params)
+                    search.errors[page] = "%s: %s" % (type(e).__name__, e)
+                    if isinstance(e, APIError):
+                        self.client.retry_queue.append(params)
+            finally:
+                # always release the task, or the other workers wait forever
+                self._task_done(search, page, hits)
+
+    def run(self, searches):
+        '''
+        Collects every search and returns a summary per search name.
+        `searches` holds Search objects or (q, begin, end) tuples.
+        '''
+        searches = [s if isinstance(s, Search) else Search(*s)
+                    for s in searches]
+        for search in searches:
+            if search.name in self._queues:
+                raise ValueError("duplicate search: %s" % search.name)
+            if search.pages is None:
+                first = [(search, 0)]
+            else:
+                first = [(search, i) for i in range(search.pages)]
+            self._queues[search.name] = collections.deque(first)
+            self._turns.append(search.name)
+            path = os.path.join(self.output_dir, search.name + ".jsonl")
+            self._files[search.name] = (open(path, "w"), threading.Lock())
+
+        threads = [threading.Thread(target=self._work)
+                   for _ in range(self.workers)]
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            for f, _ in self._files.values():
+                f.close()
+            self._files = {}
+            self._queues.clear()
+            self._turns.clear()
+        return collections.OrderedDict((s.name, s.summary())
+                                       for s in searches)
+
+
+def collect_batch(client, searches, output_dir, workers=2):
+    '''Shortcut for BatchCollector(client, output_dir, workers).run(searches).'''
+    return BatchCollector(client, output_dir, workers).run(searches)
@@ -0,0 +1,342 @@
+# coding: utf-8
+
+'''
+Request layer for the NYT Article Search API.
+
+The loop in the lecture calls `json.loads(rr.text)` on whatever comes back and
+sleeps for a fixed 7 seconds. That works for a handful of pages, but a single
+429 (too many requests) or 5xx (server error) either crashes the run or stores
+an error message as if it were data. NYTClient checks every response, retries
+with exponential backoff plus jitter, honours the `Retry-After` header and
+shares a circuit breaker between workers so everybody pauses when errors spike.
+'''
+
+import collections
+import json
+import math
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+
+from nyt.archive import window_key
+from nyt.metrics import Metrics
+
+BASE_URL = "http://api.nytimes.com/svc/search/v2/articlesearch.json"
+
+# the API returns 10 docs per page
+PAGE_SIZE = 10
+
+# the API allows 10 requests per minute and 4,000 per day for each key
+REQUEST_INTERVAL = 6.0
+DAILY_LIMIT = 4000
+
+# status codes worth trying again; anything else (401 bad key, 400 bad
+# parameters...) will fail the same way every time
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class APIError(Exception):
+    '''
+    Raised when a request still fails after all of its retries, or fails
+    in a way that retrying cannot fix.
+    '''
+    def __init__(self, message, status=None):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class RateLimiter(object):
+    '''
+    Spaces requests at least `interval` seconds apart. One limiter can be
+    shared by several threads; each call to wait() reserves the next slot.
+    '''
+    def __init__(self, interval=REQUEST_INTERVAL):
+        self.interval = interval
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        # book the next free slot and return how long until it starts
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next)
+            self._next = start + self.interval
+            return start - now
+
+    def next_slot(self):
+        with self._lock:
+            return self._next
+
+    def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class KeyPool(object):
+    '''
+    Several API keys, each with its own RateLimiter. wait() picks the key that
+    is free soonest, so n keys give n times the request rate and daily quota.
+    '''
+    def __init__(self, keys, interval=REQUEST_INTERVAL,
+                 daily_limit=DAILY_LIMIT, limiters=None):
+        self.keys = list(keys)
+        if not self.keys:
+            raise ValueError("KeyPool needs at least one key")
+        self.limiters = limiters or [RateLimiter(interval) for _ in self.keys]
+        self.daily_limit = daily_limit
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def interval(self):
+        '''Average seconds between requests across the whole pool.'''
+        return self.limiters[0].interval / float(len(self.keys))
+
+    @property
+    def daily_quota(self):
+        return self.daily_limit * len(self.keys)
+
+    def wait(self):
+        with self._lock:
+            i = min(range(len(self.keys)),
+                    key=lambda j: self.limiters[j].next_slot())
+            delay = self.limiters[i].reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return self.keys[i]
+
+
+class CircuitBreaker(object):
+    '''
+    Counts recent failures. Once `threshold` failures happen within `window`
+    seconds the breaker opens and every worker calling wait() sleeps for
+    `cooldown` seconds before trying again.
+    '''
+    def __init__(self, threshold=5, window=60.0, cooldown=60.0):
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self._failures = collections.deque()
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    def record_success(self):
+        with self._lock:
+            self._failures.clear()
+
+    def record_failure(self):
+        with self._lock:
+            now = time.time()
+            self._failures.append(now)
+            while self._failures and self._failures[0] < now - self.window:
+                self._failures.popleft()
+            if len(self._failures) >= self.threshold:
+                self._open_until = max(self._open_until, now + self.cooldown)
+                self._failures.clear()
+
+    def pause(self, seconds):
+        # used for Retry-After: the server told us when to come back
+        with self._lock:
+            self._open_until = max(self._open_until, time.time() + seconds)
+
+    @property
+    def is_open(self):
+        return time.time() < self._open_until
+
+    def wait(self):
+        while True:
+            with self._lock:
+                remaining = self._open_until - time.time()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    '''
+    Exponential backoff with "full jitter": a random wait between 0 and
+    base * 2**attempt, capped at `cap`. The randomness keeps workers that
+    failed together from retrying together.
+    '''
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_after_seconds(response):
+    '''
+    Reads the Retry-After header, which is either a number of seconds or an
+    HTTP date. Returns None when the header is missing or unreadable.
+    '''
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class NYTClient(object):
+    '''
+    Makes checked, retried requests to the Article Search API.
+
+    get() returns the parsed JSON for one page. collect() fetches every page
+    for a search; pages that still fail go to `retry_queue` and are retried
+    at the end of the run instead of aborting it. Counters and timings are
+    kept in `metrics`.
+
+    `key` is one API key or a KeyPool. If `archive` (a ResponseArchive) is
+    given, every response is saved to it and pages already in the archive are
+    read from disk instead of the API.
+    '''
+    def __init__(self, key, session=None, limiter=None, breaker=None,
+                 max_retries=5, backoff_base=1.0, backoff_cap=60.0,
+                 timeout=30, retry_rounds=2, metrics=None, archive=None):
+        self.session = session or requests.Session()
+        if isinstance(key, KeyPool):
+            self.keys = key
+            self.limiter = key.limiters[0]
+        else:
+            self.limiter = limiter or RateLimiter()
+            self.keys = KeyPool([key], limiters=[self.limiter])
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.timeout = timeout
+        self.retry_rounds = retry_rounds
+        self.retry_queue = collections.deque()
+        self.metrics = metrics or Metrics()
+        self.archive = archive
+
+    def get(self, params):
+        '''
+        Requests one page. `params` holds the search parameters (q,
+        begin_date, end_date, page); the API key is added here.
+        '''
+        search_params = dict(params)
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                self.metrics.inc("retries")
+            self.breaker.wait()
+            search_params["api-key"] = self.keys.wait()
+            self.metrics.inc("requests")
+            started = time.time()
+            try:
+                r = self.session.get(BASE_URL, params=search_params,
+                                     timeout=self.timeout)
+            except requests.RequestException as e:
+                # timeouts, dropped connections, DNS hiccups
+                error = APIError("request failed: %s" % e)
+                self.metrics.inc("errors")
+                self.breaker.record_failure()
+                self._pause(attempt, backoff_delay(attempt, self.backoff_base,
+                                                   self.backoff_cap))
+                continue
+            self.metrics.observe_latency(time.time() - started)
+            self.metrics.inc("bytes_received", len(r.content))
+
+            if r.status_code == 200:
+                try:
+                    data = json.loads(r.text)
+                    data["response"]["docs"]
+                except (ValueError, KeyError, TypeError):
+                    # a 200 with a truncated or unexpected body
+                    error = APIError("malformed response", r.status_code)
+                    self.metrics.inc("errors")
+                    self.breaker.record_failure()
+                    self._pause(attempt, backoff_delay(
+                        attempt, self.backoff_base, self.backoff_cap))
+                    continue
+                self.breaker.record_success()
+                self.metrics.inc("docs", len(data["response"]["docs"]))
+                return data
+
+            self.metrics.inc("errors")
+            if r.status_code == 429:
+                self.metrics.inc("rate_limited")
+            if r.status_code not in RETRY_STATUSES:
+                raise APIError("HTTP %d: %s" % (r.status_code, r.text[:200]),
+                               r.status_code)
+
+            error = APIError("HTTP %d" % r.status_code, r.status_code)
+            self.breaker.record_failure()
+            delay = retry_after_seconds(r)
+            if delay is None:
+                delay = backoff_delay(attempt, self.backoff_base,
+                                      self.backoff_cap)
+            else:
+                # the quota is shared, so make every worker wait
+                self.breaker.pause(delay)
+            self._pause(attempt, delay)
+        raise error
+
+    def _pause(self, attempt, delay):
+        # wait before the next attempt; after the last one there is none
+        if attempt < self.max_retries:
+            time.sleep(delay)
+
+    def fetch_page(self, params):
+        '''
+        Like get(), but goes through the archive when the client has one.
+        '''
+        if self.archive is None:
+            return self.get(params)
+        key = (params["q"], window_key(params["begin_date"],
+                                       params["end_date"]),
+               int(params.get("page", 0)))
+        if key in self.archive:
+            self.metrics.inc("cache_hits")
+            return self.archive.get(*key)
+        data = self.get(params)
+        self.archive.append(key[0], key[1], key[2], data)
+        return data
+
+    def collect(self, q, begin, end):
+        '''
+        Returns all docs for `q` between `begin` and `end` (YYYYMMDD strings),
+        in page order. Pages that fail are queued and retried after the main
+        pass; anything left in `retry_queue` afterwards is missing from the
+        result.
+        '''
+        params = {"q": q, "begin_date": begin, "end_date": end, "page": 0}
+        first = self.fetch_page(params)
+        hits = first["response"]["meta"]["hits"]
+        pages = int(math.ceil(hits / float(PAGE_SIZE)))
+
+        docs_by_page = {0: first["response"]["docs"]}
+        failed = collections.deque()
+        for i in range(1, pages):
+            page_params = dict(params, page=i)
+            try:
+                data = self.fetch_page(page_params)
+                docs_by_page[i] = data["response"]["docs"]
+            except APIError:
+                failed.append(page_params)
+
+        for _ in range(self.retry_rounds):
+            for _ in range(len(failed)):
+                page_params = failed.popleft()
+                try:
+                    data = self.fetch_page(page_params)
+                except APIError:
+                    failed.append(page_params)
+                else:
+                    docs_by_page[page_params["page"]] = data["response"]["docs"]
+        self.retry_queue.extend(failed)
+
+        all_docs = []
+        for i in sorted(docs_by_page):
+            all_docs.extend(docs_by_page[i])
+        return all_docs
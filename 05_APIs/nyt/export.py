@@ -0,0 +1,173 @@
+# coding: utf-8
+
+'''
+Write formatted articles to CSV or Parquet in batches.
+
+The lecture collects everything first and writes the CSV at the very end, so
+a crash late in a run loses all of it. ArticleWriter writes every
+`batch_size` articles to a numbered part file as they come in. Each part is
+written under a temporary name and then renamed, so a part file on disk is
+always complete. close() joins the parts into the final file the same way.
+'''
+
+import csv
+import datetime
+import glob
+import os
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# column name -> type; the columns produced by format_articles()
+ARTICLE_SCHEMA = (("id", "string"), ("headline", "string"), ("date", "date"))
+
+
+def _text(value):
+    # format_articles() encodes headlines to utf-8 bytes
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return value
+
+
+def _date(value):
+    value = _text(value)
+    if value in (None, ""):
+        return None
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(value[:10], "%Y-%m-%d").date()
+
+
+class ArticleWriter(object):
+    '''
+    Buffers articles (dicts with the schema's keys) and flushes them every
+    `batch_size` rows to `<path>.part-00000`, `<path>.part-00001`, ... Call
+    close(), or use the writer in a `with` block, to produce `path`.
+
+    `fmt` is "csv" or "parquet" (needs pyarrow). Extra keys in an article
+    are ignored; missing keys are written as empty values.
+
+    Part files left by a run that crashed are deleted, unless `resume` is
+    True, in which case they are kept and end up in the final file.
+    '''
+    def __init__(self, path, fmt="csv", batch_size=1000,
+                 schema=ARTICLE_SCHEMA, resume=False):
+        if fmt not in ("csv", "parquet"):
+            raise ValueError("fmt must be 'csv' or 'parquet'")
+        if fmt == "parquet" and pyarrow is None:
+            raise ImportError("Parquet output needs `pip install pyarrow`")
+        self.path = path
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.schema = schema
+        self.columns = [name for name, _ in schema]
+        self.buffer = []
+        self.parts = []
+        self.rows = 0
+        for old in sorted(glob.glob(glob.escape(path) + ".part-*")):
+            if resume and not old.endswith(".tmp"):
+                self.parts.append(old)
+                self.rows += len(self._read_part(old))
+            else:
+                os.remove(old)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # keep the parts written so far for inspection, but flush what
+            # is in memory so nothing collected is lost
+            self.flush()
+
+    def _row(self, article):
+        row = []
+        for name, kind in self.schema:
+            value = article.get(name)
+            row.append(_date(value) if kind == "date" else _text(value))
+        return row
+
+    def write(self, article):
+        self.buffer.append(self._row(article))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def writerows(self, articles):
+        for article in articles:
+            self.write(article)
+
+    def _write_file(self, path, rows_or_parts):
+        # write under a temporary name, then rename over the target
+        tmp = path + ".tmp"
+        if self.fmt == "csv":
+            with open(tmp, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(self.columns)
+                for rows in rows_or_parts():
+                    writer.writerows(rows)
+        else:
+            writer = pyarrow.parquet.ParquetWriter(tmp, self._arrow_schema())
+            try:
+                for rows in rows_or_parts():
+                    writer.write_table(self._arrow_table(rows))
+            finally:
+                writer.close()
+        os.replace(tmp, path)
+
+    def _arrow_schema(self):
+        types = {"string": pyarrow.string(), "date": pyarrow.date32()}
+        return pyarrow.schema([(name, types[kind])
+                               for name, kind in self.schema])
+
+    def _arrow_table(self, rows):
+        columns = list(zip(*rows)) if rows else [[] for _ in self.columns]
+        return pyarrow.Table.from_arrays(
+            [pyarrow.array(list(c), type=field.type)
+             for c, field in zip(columns, self._arrow_schema())],
+            schema=self._arrow_schema())
+
+    def _read_part(self, path):
+        if self.fmt == "csv":
+            with open(path, newline="", encoding="utf-8") as f:
+                reader = csv.reader(f)
+                next(reader)
+                return list(reader)
+        table = pyarrow.parquet.read_table(path)
+        return list(zip(*[table.column(n).to_pylist() for n in self.columns]))
+
+    def flush(self):
+        '''Writes the buffered articles to a new part file.'''
+        if not self.buffer:
+            return
+        part = "%s.part-%05d" % (self.path, len(self.parts))
+        rows = self.buffer
+        self._write_file(part, lambda: [rows])
+        self.parts.append(part)
+        self.rows += len(rows)
+        self.buffer = []
+
+    def close(self):
+        '''Flushes the buffer and joins all parts into `path`.'''
+        self.flush()
+        parts = list(self.parts)
+        self._write_file(self.path,
+                         lambda: (self._read_part(p) for p in parts))
+        for part in parts:
+            os.remove(part)
+        self.parts = []
+        return self.path
+
+
+def write_articles(articles, path, fmt="csv", batch_size=1000):
+    '''
+    Writes an iterable of formatted articles to `path` and returns the
+    number of rows written.
+    '''
+    with ArticleWriter(path, fmt, batch_size) as writer:
+        writer.writerows(articles)
+    return writer.rows
@@ -0,0 +1,129 @@
+# coding: utf-8
+
+'''
+Counters and timings for a collection run.
+
+Every NYTClient keeps a Metrics object in `client.metrics`. Read the numbers
+from Python while the run is going, or dump them at the end with to_json()
+or to_prometheus() to compare runs and tune concurrency and quota use.
+'''
+
+import bisect
+import json
+import threading
+import time
+
+# upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+COUNTERS = ("requests", "cache_hits", "retries", "rate_limited",
+            "errors", "bytes_received", "docs")
+
+
+class Histogram(object):
+    '''
+    Cumulative histogram in the Prometheus style: counts[i] is the number of
+    observations less than or equal to buckets[i]; the last slot is +Inf.
+    '''
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        out = []
+        for n in self.counts:
+            total += n
+            out.append(total)
+        return out
+
+    def to_dict(self):
+        bounds = [str(b) for b in self.buckets] + ["+Inf"]
+        return {"buckets": dict(zip(bounds, self.cumulative())),
+                "count": self.count,
+                "sum": self.sum}
+
+
+class Metrics(object):
+    '''
+    Thread-safe counters plus a request latency histogram.
+
+    Counters: requests issued, cache hits, retries, 429 responses
+    (`rate_limited`), failed attempts, bytes received and docs collected.
+    '''
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.started = time.time()
+        self.counters = dict((name, 0) for name in COUNTERS)
+        self.latency = Histogram(buckets)
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe_latency(self, seconds):
+        with self._lock:
+            self.latency.observe(seconds)
+
+    def __getitem__(self, name):
+        return self.counters[name]
+
+    def elapsed(self):
+        return time.time() - self.started
+
+    def docs_per_second(self):
+        elapsed = self.elapsed()
+        if elapsed <= 0:
+            return 0.0
+        return self.counters["docs"] / elapsed
+
+    def to_dict(self):
+        with self._lock:
+            out = dict(self.counters)
+            out["latency_seconds"] = self.latency.to_dict()
+        out["elapsed_seconds"] = self.elapsed()
+        out["docs_per_second"] = self.docs_per_second()
+        return out
+
+    def to_json(self, path=None):
+        '''
+        Returns the metrics as a JSON string; also writes them to `path`
+        if one is given.
+        '''
+        text = json.dumps(self.to_dict(), indent=2)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
+
+    def to_prometheus(self, prefix="nyt_collector"):
+        '''
+        Returns the metrics in the Prometheus text exposition format, e.g. for
+        the node_exporter textfile collector.
+        '''
+        d = self.to_dict()
+        lines = []
+        for name in sorted(self.counters):
+            metric = "%s_%s_total" % (prefix, name)
+            lines.append("# TYPE %s counter" % metric)
+            lines.append("%s %d" % (metric, d[name]))
+
+        metric = "%s_request_latency_seconds" % prefix
+        lines.append("# TYPE %s histogram" % metric)
+        for bound, n in d["latency_seconds"]["buckets"].items():
+            lines.append('%s_bucket{le="%s"} %d' % (metric, bound, n))
+        lines.append("%s_sum %f" % (metric, d["latency_seconds"]["sum"]))
+        lines.append("%s_count %d" % (metric, d["latency_seconds"]["count"]))
+
+        for name in ("elapsed_seconds", "docs_per_second"):
+            metric = "%s_%s" % (prefix, name)
+            lines.append("# TYPE %s gauge" % metric)
+            lines.append("%s %f" % (metric, d[name]))
+        return "\n".join(lines) + "\n"
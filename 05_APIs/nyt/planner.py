@@ -0,0 +1,166 @@
+# coding: utf-8
+
+'''
+Plan a collection before running it.
+
+The lecture code only learns `hits` after requesting the first page, and then
+computes pages = ceil(hits/10). plan_collection() does that first request for
+every search up front (and nothing more), so you know how many requests, how
+many days of quota and how much wall time a collection will take before you
+commit to it. The API serves at most 100 pages per search, so date windows
+with more hits than that are split in half until each part fits.
+
+The plan can be saved as JSON and run later with run_plan().
+'''
+
+import datetime
+import json
+import math
+
+from nyt.archive import window_key
+from nyt.batch import Search, collect_batch
+from nyt.client import PAGE_SIZE
+
+# the API refuses page numbers above this, so each window can return at
+# most MAX_PAGES * PAGE_SIZE docs
+MAX_PAGES = 100
+
+DATE_FORMAT = "%Y%m%d"
+
+
+def _parse(day):
+    return datetime.datetime.strptime(day, DATE_FORMAT).date()
+
+
+def _format(day):
+    return day.strftime(DATE_FORMAT)
+
+
+def split_window(begin, end):
+    '''
+    Splits the date range [begin, end] (YYYYMMDD strings) into two halves.
+    Returns None for a single day, which cannot be split.
+    '''
+    first, last = _parse(begin), _parse(end)
+    if first >= last:
+        return None
+    middle = first + (last - first) // 2
+    return ((begin, _format(middle)),
+            (_format(middle + datetime.timedelta(days=1)), end))
+
+
+class Plan(object):
+    '''
+    The windows to collect (query, date range, hits, pages) plus what it
+    took to find them. estimate() turns it into request and time estimates
+    for a given request interval and daily quota.
+    '''
+    def __init__(self, windows, probe_requests=0, interval=None,
+                 daily_quota=None, archived_probes=False):
+        self.windows = windows
+        self.probe_requests = probe_requests
+        self.interval = interval
+        self.daily_quota = daily_quota
+        self.archived_probes = archived_probes
+
+    @property
+    def requests(self):
+        return sum(w["pages"] for w in self.windows)
+
+    def estimate(self):
+        '''
+        Returns the number of requests still needed, the days of quota they
+        use up and the expected wall time in seconds.
+        '''
+        remaining = self.requests
+        if self.archived_probes:
+            # first pages came back during probing and are in the archive
+            remaining -= sum(1 for w in self.windows if w["pages"] > 0)
+        quota_days = int(math.ceil(remaining / float(self.daily_quota)))
+        if quota_days > 1:
+            # wait for the quota to reset after each full day
+            last_day = remaining - (quota_days - 1) * self.daily_quota
+            wall = (quota_days - 1) * 86400 + last_day * self.interval
+        else:
+            wall = remaining * self.interval
+        return {"windows": len(self.windows),
+                "hits": sum(w["hits"] for w in self.windows),
+                "requests": self.requests,
+                "probe_requests": self.probe_requests,
+                "remaining_requests": remaining,
+                "quota_days": quota_days,
+                "wall_seconds": wall,
+                "truncated_windows": sum(1 for w in self.windows
+                                         if w["truncated"])}
+
+    def searches(self):
+        '''The windows as Search objects, ready for BatchCollector.'''
+        out = []
+        for w in self.windows:
+            search = Search(w["q"], w["begin"], w["end"], pages=w["pages"])
+            search.hits = w["hits"]
+            out.append(search)
+        return out
+
+    def to_dict(self):
+        return {"windows": self.windows,
+                "probe_requests": self.probe_requests,
+                "interval": self.interval,
+                "daily_quota": self.daily_quota,
+                "archived_probes": self.archived_probes}
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(**json.load(f))
+
+
+def probe_hits(client, q, begin, end):
+    '''Asks for the first page of a search and returns its number of hits.'''
+    data = client.fetch_page({"q": q, "begin_date": begin, "end_date": end,
+                              "page": 0})
+    return data["response"]["meta"]["hits"]
+
+
+def plan_collection(client, searches, max_pages=MAX_PAGES):
+    '''
+    Probes every search in `searches` ((q, begin, end) tuples) with one
+    request per date window and returns a Plan. Windows with more than
+    `max_pages` pages of hits are split by date until they fit; a single day
+    that still does not fit is kept and marked as truncated.
+
+    Give the client an archive and the probed first pages are reused by the
+    actual run instead of being requested again.
+    '''
+    windows = []
+    probes = 0
+    for q, begin, end in searches:
+        todo = [(begin, end)]
+        while todo:
+            w_begin, w_end = todo.pop(0)
+            hits = probe_hits(client, q, w_begin, w_end)
+            probes += 1
+            pages = int(math.ceil(hits / float(PAGE_SIZE)))
+            if pages > max_pages:
+                halves = split_window(w_begin, w_end)
+                if halves is not None:
+                    todo = list(halves) + todo
+                    continue
+            windows.append({"q": q, "begin": w_begin, "end": w_end,
+                            "window": window_key(w_begin, w_end),
+                            "hits": hits,
+                            "pages": min(pages, max_pages),
+                            "truncated": pages > max_pages})
+    return Plan(windows, probe_requests=probes,
+                interval=client.keys.interval,
+                daily_quota=client.keys.daily_quota,
+                archived_probes=client.archive is not None)
+
+
+def run_plan(client, plan, output_dir, workers=2):
+    '''Collects every window of `plan` with a BatchCollector.'''
+    return collect_batch(client, plan.searches(), output_dir, workers)
@@ -0,0 +1,82 @@
+# coding: utf-8
+
+'''
+apisearch() as an iterator that fetches ahead.
+
+In the lecture loop every step waits for the one before it: request a page,
+parse it, format it, write it, then request the next page. Here the next
+pages are requested in background threads while the caller is still busy
+with the current one, so parsing and writing hide behind network latency.
+'''
+
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+from nyt.client import PAGE_SIZE, APIError, NYTClient
+
+
+def apisearch(q, begin, end, key=None, pg=None, prefetch=2, client=None):
+    '''
+    Yields the docs of each results page for `q` between `begin` and `end`
+    (YYYYMMDD strings), in page order.
+
+    At most `prefetch` pages are requested ahead of the one being processed;
+    with prefetch=0 each page is only requested once the previous one has
+    been handed over.
+    Pass `pg` to get a single page only. Either give an API `key` or a
+    configured NYTClient as `client`. Pages that fail after all retries are
+    skipped and left in `client.retry_queue`.
+    '''
+    if client is None:
+        client = NYTClient(key)
+    params = {"q": q, "begin_date": begin, "end_date": end}
+
+    if pg is not None:
+        yield client.fetch_page(dict(params, page=int(pg)))["response"]["docs"]
+        return
+
+    # the first page tells us how many pages there are
+    first = client.fetch_page(dict(params, page=0))
+    hits = first["response"]["meta"]["hits"]
+    pages = int(math.ceil(hits / float(PAGE_SIZE)))
+
+    executor = ThreadPoolExecutor(max_workers=max(1, prefetch))
+    pending = []
+    next_page = 1
+    try:
+        # start fetching the next pages before handing over the first one
+        while next_page < pages and len(pending) < prefetch:
+            page_params = dict(params, page=next_page)
+            pending.append((page_params,
+                            executor.submit(client.fetch_page, page_params)))
+            next_page += 1
+        yield first["response"]["docs"]
+
+        while pending or next_page < pages:
+            if not pending:
+                # with prefetch=0 nothing is requested ahead: fetch the next
+                # page now
+                page_params = dict(params, page=next_page)
+                pending.append((page_params,
+                                executor.submit(client.fetch_page,
+                                                page_params)))
+                next_page += 1
+            page_params, future = pending.pop(0)
+            # keep the pipeline full: one new request for each one consumed
+            if next_page < pages and len(pending) < prefetch:
+                new_params = dict(params, page=next_page)
+                pending.append((new_params,
+                                executor.submit(client.fetch_page,
+                                                new_params)))
+                next_page += 1
+            try:
+                data = future.result()
+            except APIError:
+                client.retry_queue.append(page_params)
+                continue
+            yield data["response"]["docs"]
+    finally:
+        # runs when the loop finishes or the caller stops early
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
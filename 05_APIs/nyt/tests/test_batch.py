@@ -0,0 +1,36 @@
+# coding: utf-8
+
+import collections
+
+from nyt.batch import BatchCollector
+
+
+class FakeClient(object):
+    '''Answers 5 pages of 10 hits each; `broken` pages raise ValueError.'''
+    def __init__(self, broken=()):
+        self.broken = set(broken)
+        self.retry_queue = collections.deque()
+
+    def fetch_page(self, params):
+        if params["page"] in self.broken:
+            raise ValueError("bad page %d" % params["page"])
+        return {"response": {"meta": {"hits": 50},
+                             "docs": [{"page": params["page"]}] * 10}}
+
+
+def test_every_page_is_collected(tmp_path):
+    summary = BatchCollector(FakeClient(), str(tmp_path)).run(
+        [("q", "20200101", "20200102")])
+    search = summary["q_20200101_20200102"]
+    assert search["docs"] == 50
+    assert search["failed"] == []
+
+
+def test_unexpected_errors_are_recorded(tmp_path):
+    summary = BatchCollector(FakeClient(broken=[2]), str(tmp_path)).run(
+        [("q", "20200101", "20200102")])
+    search = summary["q_20200101_20200102"]
+    # the other pages are still collected, and page 2 is reported
+    assert search["docs"] == 40
+    assert search["failed"] == [2]
+    assert "ValueError" in search["errors"][2]
@@ -0,0 +1,37 @@
+# coding: utf-8
+
+import time
+
+import pytest
+
+from nyt.client import APIError, NYTClient, RateLimiter
+
+
+class Response(object):
+    def __init__(self, status_code, headers=None, text=""):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = text
+        self.content = text.encode("utf-8")
+
+
+class ThrottledSession(object):
+    '''Always answers 429 with Retry-After: 1.'''
+    def __init__(self):
+        self.requests = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.requests += 1
+        return Response(429, {"Retry-After": "1"})
+
+
+def test_no_wait_after_the_last_attempt():
+    session = ThrottledSession()
+    client = NYTClient("key", session=session, max_retries=2,
+                       limiter=RateLimiter(0))
+    started = time.time()
+    with pytest.raises(APIError):
+        client.get({"q": "x", "page": 0})
+    # three requests, with a wait only between them
+    assert session.requests == 3
+    assert time.time() - started < 2.9
@@ -0,0 +1,61 @@
+# coding: utf-8
+
+import threading
+import time
+
+from nyt.planner import Plan
+from nyt.workqueue import WorkQueue, main, run_worker
+
+
+class SlowClient(object):
+    '''Takes longer than the lease for every page, like a rate-limit wait.'''
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.archive = object()
+        self.fetched = []
+
+    def fetch_page(self, params):
+        self.fetched.append(params["page"])
+        time.sleep(self.seconds)
+        return {"response": {"meta": {"hits": 20}, "docs": []}}
+
+
+def test_leases_are_renewed_while_working(tmp_path):
+    path = str(tmp_path / "queue.db")
+    WorkQueue(path).add_pages("q", "20200101", "20200102", 2)
+    client = SlowClient(2.5)
+    done = []
+    workers = [threading.Thread(target=lambda owner=owner: done.append(
+        run_worker(WorkQueue(path, lease_seconds=1), client, str(tmp_path),
+                   owner=owner, poll=0.2)))
+        for owner in ("a", "b")]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    # each page was fetched once, although every fetch outlasted the lease
+    assert sorted(client.fetched) == [0, 1]
+    assert sorted(done) == [1, 1]
+
+
+def test_expired_leases_count_as_attempts(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.db"), lease_seconds=0.01,
+                      max_attempts=2)
+    queue.add_pages("q", "20200101", "20200102", 1)
+    leased = 0
+    for _ in range(4):
+        if queue.lease("crashing worker") is not None:
+            leased += 1
+        time.sleep(0.05)
+    assert leased == 2
+    assert queue.counts() == {"failed": 1}
+
+
+def test_add_command_queues_a_plan(tmp_path):
+    plan_path = str(tmp_path / "plan.json")
+    Plan([{"q": "q", "begin": "20200101", "end": "20200102", "hits": 25,
+           "pages": 3}]).save(plan_path)
+    path = str(tmp_path / "queue.db")
+    main(["add", path, "--plan", plan_path,
+          "--search", "other", "20200101", "20200131"])
+    assert WorkQueue(path).counts() == {"pending": 4}
@@ -0,0 +1,359 @@
+# coding: utf-8
+
+'''
+Spread a collection over several processes (or machines) with SQLite.
+
+A coordinator writes tasks -- single pages, or whole windows whose pages are
+discovered from the first one -- into a SQLite file. Any number of worker
+processes open the same file, lease a task, fetch it, save the response to
+their own archive folder and mark the task done. While a worker is busy with
+a task -- including while it waits for its turn under the rate limit -- it
+renews its lease every few seconds. A worker that crashes simply stops
+renewing; once the lease expires another worker picks the task up, and a
+task whose lease has run out `max_attempts` times is marked failed. The
+request rate of every key is coordinated through the same file, so adding
+workers never breaks the API limits.
+
+From the 05_APIs folder, queue the work once -- a plan saved by
+nyt.planner, or whole searches -- and then start as many workers as you
+like:
+
+    python -m nyt.workqueue add data_raw/queue.db --plan data_raw/plan.json
+    python -m nyt.workqueue add data_raw/queue.db \\
+        --search impeachment+trump 20200101 20200131
+    python -m nyt.workqueue work data_raw/queue.db data_raw/archive \\
+        --keys KEY1 KEY2
+
+The same from Python: WorkQueue(path).add_plan(plan) or add_window(q, begin,
+end), then run_worker(queue, client, archive_dir) in each worker.
+
+Workers on other hosts need the database on a shared filesystem whose
+locking works with SQLite (a local disk, or NFS with working locks).
+'''
+
+import argparse
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from nyt.archive import ResponseArchive
+from nyt.client import (PAGE_SIZE, REQUEST_INTERVAL, APIError, KeyPool,
+                        NYTClient)
+from nyt.planner import Plan
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    q TEXT NOT NULL,
+    begin_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    expand INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_expires REAL,
+    error TEXT,
+    UNIQUE (q, begin_date, end_date, page)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_expires);
+CREATE TABLE IF NOT EXISTS rate_limits (
+    name TEXT PRIMARY KEY,
+    next_slot REAL NOT NULL
+);
+'''
+
+
+def connect(path):
+    '''
+    Opens the queue database. Transactions are started by hand (BEGIN
+    IMMEDIATE) so that reading and updating a task happen under one lock.
+    '''
+    conn = sqlite3.connect(path, timeout=60, isolation_level=None,
+                           check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class WorkQueue(object):
+    '''
+    Tasks stored in SQLite. Each task is one page of one search; a task with
+    `expand` set adds the remaining pages of its window once it is done.
+    '''
+    def __init__(self, path, lease_seconds=300, max_attempts=5):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.conn = connect(path)
+        self._lock = threading.Lock()
+
+    def _transaction(self, fn):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self.conn)
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+    def add_pages(self, q, begin, end, pages):
+        '''Queues pages 0 to pages-1 of a search.'''
+        rows = [(q, begin, end, i) for i in range(pages)]
+        self._transaction(lambda c: c.executemany(
+            "INSERT OR IGNORE INTO tasks (q, begin_date, end_date, page) "
+            "VALUES (?, ?, ?, ?)", rows))
+
+    def add_window(self, q, begin, end):
+        '''Queues the first page of a search; it adds the rest when done.'''
+        self._transaction(lambda c: c.execute(
+            "INSERT OR IGNORE INTO tasks (q, begin_date, end_date, page, "
+            "expand) VALUES (?, ?, ?, 0, 1)", (q, begin, end)))
+
+    def add_plan(self, plan):
+        '''Queues every page of a Plan from nyt.planner.'''
+        for w in plan.windows:
+            self.add_pages(w["q"], w["begin"], w["end"], w["pages"])
+
+    def lease(self, owner):
+        '''
+        Hands out one pending task (or one whose lease has expired) and
+        returns it as a dict, or None when nothing is available right now.
+        '''
+        def take(c):
+            now = time.time()
+            # a task that keeps crashing its workers is not handed out forever
+            c.execute("UPDATE tasks SET status = 'failed', owner = NULL, "
+                      "error = 'lease expired', lease_expires = NULL "
+                      "WHERE status = 'leased' AND lease_expires < ? "
+                      "AND attempts >= ?", (now, self.max_attempts))
+            row = c.execute(
+                "SELECT * FROM tasks WHERE status = 'pending' OR "
+                "(status = 'leased' AND lease_expires < ?) "
+                "ORDER BY id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            c.execute("UPDATE tasks SET status = 'leased', owner = ?, "
+                      "lease_expires = ?, attempts = attempts + 1 "
+                      "WHERE id = ?",
+                      (owner, now + self.lease_seconds, row["id"]))
+            return dict(row)
+        return self._transaction(take)
+
+    def renew(self, task, owner):
+        '''
+        Extends the lease on a task by `lease_seconds`. Returns False if
+        `owner` no longer holds it.
+        '''
+        def extend(c):
+            return c.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE id = ? AND "
+                "owner = ? AND status = 'leased'",
+                (time.time() + self.lease_seconds, task["id"],
+                 owner)).rowcount > 0
+        return self._transaction(extend)
+
+    def complete(self, task, owner, hits=None):
+        '''
+        Marks a task done. For an expanding task, `hits` from its response
+        queues the remaining pages of the window. Returns False if `owner`
+        had lost the task to another worker (its lease expired).
+        '''
+        def finish(c):
+            # the other pages are queued either way: the response is the same
+            done = c.execute("UPDATE tasks SET status = 'done', error = NULL "
+                             "WHERE id = ? AND owner = ?",
+                             (task["id"], owner)).rowcount > 0
+            if task["expand"] and hits is not None:
+                pages = int(math.ceil(hits / float(PAGE_SIZE)))
+                c.executemany(
+                    "INSERT OR IGNORE INTO tasks (q, begin_date, end_date, "
+                    "page) VALUES (?, ?, ?, ?)",
+                    [(task["q"], task["begin_date"], task["end_date"], i)
+                     for i in range(1, pages)])
+            return done
+        return self._transaction(finish)
+
+    def fail(self, task, owner, error):
+        '''
+        Puts a failed task back in the queue, or marks it failed for good
+        after `max_attempts` tries.
+        '''
+        def give_back(c):
+            row = c.execute("SELECT attempts FROM tasks WHERE id = ?",
+                            (task["id"],)).fetchone()
+            status = "failed" if row["attempts"] >= self.max_attempts \
+                else "pending"
+            c.execute("UPDATE tasks SET status = ?, error = ?, owner = NULL, "
+                      "lease_expires = NULL WHERE id = ? AND owner = ?",
+                      (status, str(error), task["id"], owner))
+        self._transaction(give_back)
+
+    def counts(self):
+        '''Number of tasks per status, e.g. {'done': 120, 'pending': 30}.'''
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT status, COUNT(*) FROM tasks GROUP BY status")
+            return dict((status, n) for status, n in rows)
+
+    def unfinished(self):
+        counts = self.counts()
+        return counts.get("pending", 0) + counts.get("leased", 0)
+
+
+class SharedRateLimiter(object):
+    '''
+    A RateLimiter whose next free slot lives in the queue database, so every
+    process using the same `name` (usually the API key) shares one rate.
+    '''
+    def __init__(self, path, name, interval=REQUEST_INTERVAL):
+        self.name = name
+        self.interval = interval
+        self.conn = connect(path)
+        self._lock = threading.Lock()
+
+    def next_slot(self):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT next_slot FROM rate_limits WHERE name = ?",
+                (self.name,)).fetchone()
+        return row[0] if row else 0.0
+
+    def reserve(self):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT next_slot FROM rate_limits WHERE name = ?",
+                    (self.name,)).fetchone()
+                now = time.time()
+                start = max(now, row[0] if row else 0.0)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO rate_limits (name, next_slot) "
+                    "VALUES (?, ?)", (self.name, start + self.interval))
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+        return start - now
+
+    def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def shared_key_pool(path, keys, interval=REQUEST_INTERVAL):
+    '''A KeyPool whose limiters are coordinated through the queue database.'''
+    return KeyPool(keys, limiters=[SharedRateLimiter(path, key, interval)
+                                   for key in keys])
+
+
+class Heartbeat(object):
+    '''
+    Renews the lease on `task` every `every` seconds in a background thread
+    until stop() is called; use it as a context manager around the work.
+    '''
+    def __init__(self, queue, task, owner, every=None):
+        self.queue = queue
+        self.task = task
+        self.owner = owner
+        self.every = every or queue.lease_seconds / 3.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def _run(self):
+        while not self._stop.wait(self.every):
+            if not self.queue.renew(self.task, self.owner):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_worker(queue, client, archive_dir, owner=None, poll=5.0,
+               stop_when_empty=True):
+    '''
+    Leases and fetches tasks until the queue has nothing left to do.
+    Responses go to a ResponseArchive in `archive_dir/<owner>`, so workers
+    never write to the same files. Returns the number of tasks completed.
+    '''
+    owner = owner or "%s-%d" % (socket.gethostname(), os.getpid())
+    if client.archive is None:
+        client.archive = ResponseArchive(os.path.join(archive_dir, owner))
+    done = 0
+    while True:
+        task = queue.lease(owner)
+        if task is None:
+            # leased tasks may still expire and come back
+            if stop_when_empty and queue.unfinished() == 0:
+                return done
+            time.sleep(poll)
+            continue
+        params = {"q": task["q"], "begin_date": task["begin_date"],
+                  "end_date": task["end_date"], "page": task["page"]}
+        try:
+            # the wait for a rate-limit slot can be longer than the lease
+            with Heartbeat(queue, task, owner):
+                data = client.fetch_page(params)
+        except APIError as e:
+            queue.fail(task, owner, e)
+            continue
+        if queue.complete(task, owner, data["response"]["meta"]["hits"]):
+            done += 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Queue and collect a shared NYT collection.")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    add = commands.add_parser("add", help="queue a plan or whole searches")
+    add.add_argument("queue", help="path to the SQLite queue")
+    add.add_argument("--plan", help="a plan saved with Plan.save()")
+    add.add_argument("--search", nargs=3, action="append", default=[],
+                     metavar=("Q", "BEGIN", "END"),
+                     help="a search whose pages are found from page 0")
+
+    work = commands.add_parser("work", help="run a worker")
+    work.add_argument("queue", help="path to the SQLite queue")
+    work.add_argument("archive_dir", help="folder for worker archives")
+    work.add_argument("--keys", nargs="+", required=True,
+                      help="NYT API keys to use")
+    work.add_argument("--interval", type=float, default=REQUEST_INTERVAL,
+                      help="seconds between requests per key")
+    work.add_argument("--lease", type=float, default=300,
+                      help="seconds before an unfinished task is retried")
+    args = parser.parse_args(argv)
+
+    if args.command == "add":
+        if not args.plan and not args.search:
+            add.error("give --plan or --search")
+        queue = WorkQueue(args.queue)
+        if args.plan:
+            queue.add_plan(Plan.load(args.plan))
+        for q, begin, end in args.search:
+            queue.add_window(q, begin, end)
+        print("queue: %s" % queue.counts())
+        return
+
+    queue = WorkQueue(args.queue, lease_seconds=args.lease)
+    client = NYTClient(shared_key_pool(args.queue, args.keys, args.interval))
+    done = run_worker(queue, client, args.archive_dir)
+    print("completed %d tasks; queue: %s" % (done, queue.counts()))
+
+
+if __name__ == "__main__":
+    main()
@@ -33,6 +33,22 @@
 # 2. 
 # ``User-agent:*
 # Disallow:/ ``
+#
+# You can also let Python read robots.txt for you. RobotsCache (in the `crawler` folder)
+# downloads it once per website, tells you whether a URL may be scraped and how many
+# seconds the site asks you to wait between requests (`Crawl-delay`). PoliteScheduler
+# uses it to scrape a list of URLs from many websites at once while respecting every
+# site's rules.
+
+from crawler.robots import PoliteScheduler, RobotsCache
+
+robots = RobotsCache()
+robots.allowed('https://en.wikipedia.org/wiki/List_of_countries_ranked_by_ethnic_and_cultural_diversity_level')
+robots.crawl_delay('https://en.wikipedia.org/wiki/Turing_Award')
+
+scheduler = PoliteScheduler(robots, per_host=1, default_delay=1.0)
+pages = scheduler.crawl(['https://en.wikipedia.org/wiki/Turing_Award',
+                         'https://en.wikipedia.org/wiki/List_of_countries_ranked_by_ethnic_and_cultural_diversity_level'])
 
 # In[1]:
 
@@ -63,6 +79,16 @@ page = requests.get('https://en.wikipedia.org/wiki/List_of_countries_ranked_by_e
 
 print(page.status_code) # to check whether the down was successful; 200 is a okay sign
 
+# While you are working out how to parse a page, there is no need to download it again on
+# every run. The HTTPCache in the `crawler` folder keeps a copy on disk and only asks the
+# server whether the page has changed (or, with offline=True, never asks at all).
+
+from crawler.cache import HTTPCache
+
+cache = HTTPCache("http_cache")
+cached_page = cache.fetch('https://en.wikipedia.org/wiki/List_of_countries_ranked_by_ethnic_and_cultural_diversity_level')
+cached_page.status
+
 
 # ## Parse
 # 
@@ -140,6 +166,15 @@ for url in soup.find_all('a',
                          {'href':re.compile(r'/+')}):
     all_urls_regex.append(url.get('href'))
 
+# The same without building a soup: page_links() only looks at the <a> tags,
+# which is several times faster on big pages. It returns full URLs
+# ("https://en.wikipedia.org/wiki/...") instead of the href as written.
+# stream_links(url, pattern) does the same while the page is still downloading.
+
+from crawler.links import page_links
+
+all_urls_regex = page_links(cached_page, pattern=r'/+') # the page from HTTPCache above
+
 
 
 # In[6]:
@@ -219,6 +254,14 @@ for row in wiki_table.find_all('tr'): # for rows
         print("something is wrong") # for debugging
 
 
+# The same table in one pass, with the link and title of each country, straight into
+# a data frame (see crawler/tables.py):
+
+from crawler.tables import table_to_dataframe
+
+div_table = table_to_dataframe(wiki_table)
+
+
 # ## Turn into a data frame
 
 # Combine these lists as parts of the same data frame.
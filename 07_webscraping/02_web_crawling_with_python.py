@@ -107,6 +107,21 @@ for i in range(0,winners-1):
         print("Something is wrong") # for debugging
 
 
+# Notice that `wiki_table.find_all('tr')` runs inside the loop, so the whole table is
+# searched again for every single row. For a long table that gets slow fast (twice the
+# rows, four times the work). It is better to go through the rows once. extract_table()
+# in the crawler folder does that and keeps each cell's text, link (href) and title:
+
+from crawler.tables import table_to_dataframe
+
+winners_df = table_to_dataframe(wiki_table)
+winners_df.columns # every column with links also has a "_href" and a "_title" column
+
+# the first link column holds the winners
+first_links = winners_df.filter(like='_href').iloc[:, 0].dropna()
+new_links = ["https://en.wikipedia.org" + href for href in first_links]
+
+
 # ### Crawl through the list
 
 # Let's extract the birth information from each of the prize winner's Wikipage.
@@ -143,6 +158,217 @@ for url in new_links:
     birth_list.append(birth)
 
 
+# This loop waits for each page to download before asking for the next one. Most of the
+# time is spent waiting for the network, not running Python. The `crawler` folder next to
+# this script has a crawl() function that downloads several pages at once (but at most
+# `per_host` at a time from the same website) and returns the results in the same order
+# as the list of URLs. Run this from the 07_webscraping folder.
+
+from crawler import crawl
+
+def get_birth(page):
+    soup = BeautifulSoup(page.body, 'html.parser')
+    return soup.find("table",{"class":"vcard"}).find(text = re.compile("Born")).find_next().text
+
+birth_list = crawl(new_links, parse=get_birth, max_workers=8, per_host=4)
+
+# Every time you run this, all the pages are downloaded again. An HTTPCache keeps a copy
+# on disk: later runs only ask Wikipedia whether the page changed, and with offline=True
+# they don't touch the network at all -- handy while you are still fixing get_birth().
+
+from crawler.cache import HTTPCache
+
+cache = HTTPCache("http_cache")
+birth_list = crawl(new_links, parse=get_birth, fetcher=cache.fetch)
+
+offline_cache = HTTPCache("http_cache", offline=True)
+birth_list = crawl(new_links, parse=get_birth, fetcher=offline_cache.fetch)
+
+# get_birth() still builds a tree of the *whole* page just to read one row of the infobox.
+# extract_infobox() only parses the infobox itself. You tell it which rows you want:
+
+from crawler.infobox import Field, extract_infobox
+
+fields = {"born": Field("Born"),
+          "birth_date": Field("Born", select="span.bday")} # Wikipedia hides the ISO date in a span
+
+infoboxes = crawl(new_links, parse=lambda page: extract_infobox(page.body, fields),
+                  fetcher=cache.fetch)
+birth_list = [info["born"] for info in infoboxes]
+
+# ### Crawling further: following the links we find
+#
+# So far we only visited the pages in one list. A real crawler also follows the links
+# on the pages it visits, which means it has to remember where it has already been.
+# A Frontier does that. It stores the URLs in a small database file, so you can stop the
+# crawl and continue it later, and it cleans up every link first: "/wiki/Alan_Perlis",
+# "https://EN.wikipedia.org/wiki/Alan_Perlis#Career" and the full URL count as one page.
+
+from crawler.frontier import Frontier
+from crawler.links import page_links
+
+frontier = Frontier("turing_crawl.db")
+frontier.add_many(new_links, depth=0)
+
+def get_links(page):
+    # reads only the <a> tags, no soup needed
+    return page_links(page, pattern=r"^/wiki/[^:]+$") # articles only
+
+# two rounds: the winners' pages, then the pages they link to (only the first 50 here)
+for round in range(2):
+    batch = frontier.pop(50)
+    results = crawl([url for url, depth in batch], parse=get_links, fetcher=cache.fetch)
+    for (url, depth), links in zip(batch, results):
+        if not isinstance(links, Exception):
+            frontier.add_many(links, depth=depth + 1)
+        frontier.done(url)
+
+frontier.counts()
+
+# A focused crawl: instead of taking the links in the order they were found, give every
+# link a score and visit the best ones first. Here links whose text mentions an award, and
+# Wikipedia articles in general, score higher, and every level deeper scores lower.
+# max_depth stops the crawl from wandering off, and domain_budget caps the number of
+# pages per website.
+
+from crawler.frontier import by_anchor, by_depth, by_url, combine, extract_links
+
+scorer = combine(by_depth(),
+                 by_anchor(r"(?i)award|prize|medal", 2.0),
+                 by_url(r"^https://en\.wikipedia\.org/wiki/[^:]+$", 1.0))
+focused = Frontier("turing_focused.db", scorer=scorer, max_depth=2, domain_budget=500)
+focused.add_many(new_links, depth=0)
+
+def get_links_and_text(page):
+    soup = BeautifulSoup(page.body, 'html.parser')
+    return extract_links(soup, page.url, anchors=True) # (url, link text) pairs
+
+for round in range(3):
+    batch = focused.pop(50)
+    results = crawl([url for url, depth in batch], parse=get_links_and_text, fetcher=cache.fetch)
+    for (url, depth), links in zip(batch, results):
+        if not isinstance(links, Exception):
+            focused.add_many(links, depth=depth + 1)
+        focused.done(url)
+
+# The same crawl with several processes: ShardedCrawler gives every website to exactly
+# one worker process, so each site is still visited politely (one request at a time,
+# one second apart). The main process keeps the Frontier and adds the links the workers
+# find. Note that the processes only share the work when the crawl covers many sites:
+# every link in new_links is on en.wikipedia.org, so here one worker gets all of them
+# and the other three sit idle. Sharding pays off for a crawl that follows links out to
+# many different hosts. Like reparse(), this needs get_birth
+# to be a normal top-level function (on Windows, run it from a script with an
+# `if __name__ == "__main__":` block).
+
+from crawler.sharded import ShardedCrawler
+
+crawler = ShardedCrawler(Frontier("turing_sharded.db"), get_birth, workers=4,
+                         max_depth=1)
+for url, depth, birth in crawler.run(new_links, max_pages=200):
+    print(depth, url, birth)
+
+# ### Keeping the pages you crawled
+#
+# If you change get_birth() later, you would normally have to crawl everything again.
+# Instead, save every page you download in a WARC file (the format web archives such as
+# the Internet Archive use). reparse() runs a function over the saved pages in several
+# processes at once, without using the internet at all.
+
+from crawler import fetch_url
+from crawler.warc import WARCWriter, reparse
+
+warc = WARCWriter("warc/turing")
+birth_list = crawl(new_links, parse=get_birth, fetcher=warc.wrap(fetch_url))
+
+# later... (on Windows, run reparse() from a script with an `if __name__ == "__main__":` block)
+births = reparse("warc/turing.index.jsonl", get_birth)
+
+# ### Crawling again next week: only the pages that changed
+#
+# Most winner pages look the same a week later. A ChangeTracker remembers a fingerprint
+# (a hash) of each page's article text, so on the next crawl get_birth() only runs for
+# new or changed pages. Unchanged pages get UNCHANGED as their result, and the new
+# results are also written to a small "delta" file with only the changes.
+
+from crawler.changes import ChangeTracker, DeltaWriter, only_changed
+
+tracker = ChangeTracker("turing_changes.db")
+with DeltaWriter("turing_changes.jsonl") as delta:
+    births = crawl(new_links, parse=only_changed(tracker, get_birth, delta),
+                   fetcher=cache.fetch)
+
+# Some pages are not the same but almost: a mirror, a print version, the same article
+# under another URL. A SimHash is a fingerprint of a page's text that changes only a
+# little when the text changes a little. skip_near_duplicates() remembers the
+# fingerprints and does not run get_birth() for a page that looks like one it has
+# already seen; that page gets a NearDuplicate result saying which page it resembles.
+
+from crawler.simhash import SimHashIndex, skip_near_duplicates
+
+seen = SimHashIndex()
+births = crawl(new_links, parse=skip_near_duplicates(seen, get_birth),
+               fetcher=cache.fetch)
+
+# ### Fetching and parsing at the same time
+#
+# Parsing with BeautifulSoup keeps the CPU busy, and Python threads can only use one core
+# for that. pipeline() downloads pages in threads and parses them in separate processes,
+# one per core. It hands you each result as soon as it is ready, so you can write it out
+# right away. If parsing falls behind, downloading waits, so memory use stays small.
+# (On Windows, put this in a script with an `if __name__ == "__main__":` block.)
+
+from crawler.pipeline import pipeline
+
+with open("births.csv", "w") as f:
+    for url, birth in pipeline(new_links, get_birth):
+        f.write("%s,%s\n" % (url, birth))
+
+# ### How many requests at once?
+#
+# crawl() sends at most 2 requests at a time to each site. Some sites could take many
+# more, others start answering "429 Too Many Requests". An AdaptiveLimiter finds the
+# right number for each site by itself: it allows one more request at a time while the
+# answers come back fast and without errors, and halves the number as soon as the site
+# answers with 429, a server error, or much more slowly than before.
+
+from crawler import fetch_url
+from crawler.adaptive import AdaptiveLimiter
+
+limiter = AdaptiveLimiter(max_limit=8)
+birth_list = crawl(new_links, parse=get_birth, limiter=limiter,
+                   fetcher=limiter.wrap(fetch_url))
+limiter.metrics() # the limit each site ended up with, and how it answered
+
+# ### Where does the time go?
+#
+# A CrawlMetrics object counts pages, bytes and errors and times every download and
+# every call to get_birth(). It prints a one-line summary every 10 seconds and saves all
+# the numbers to a JSON file when the script ends. If "fetch" is large the crawl is
+# waiting for the network; if "parse" is large it is waiting for the CPU.
+
+from crawler.metrics import CrawlMetrics
+
+metrics = CrawlMetrics()
+metrics.start_progress(10)
+metrics.dump_at_exit("crawl_metrics.json")
+birth_list = crawl(new_links, parse=get_birth, metrics=metrics)
+print(metrics.summary())
+
+# ### Practising without Wikipedia
+#
+# To try out a crawler (or to check whether a change made it faster) you don't need the
+# real Wikipedia. FixtureSite runs a fake one on your own computer, with winner tables,
+# infoboxes and links between the pages. You can make it slow, or make some requests fail.
+# `python -m crawler.bench` uses it to time the crawler and the extractors.
+
+from crawler.fixtures import FixtureSite
+
+site = FixtureSite(pages=200, latency=0.1, failure_rate=0.05).start()
+test_births = crawl(site.people(), parse=get_birth)
+site.stop()
+
+
 # In[10]:
 
 
@@ -156,3 +382,14 @@ birth_list_cleaned=[]
 for element in birth_list:
     birth_list_cleaned.append(re.findall('[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]',element))
 
+# The loop above keeps only dates written like 1912-06-23, as text, and it stops at the
+# first element that is not a string (crawl() puts an exception there if a page failed).
+# extract_dates() also understands "June 23, 1912", "23 June 1912" and a year on its
+# own, returns real dates you can calculate with, and does the whole list in one go,
+# which matters once the list has millions of entries. It works on a pandas column too.
+
+from crawler.dates import extract_dates
+
+birth_dates = extract_dates(birth_list)
+birth_years = [d.year if d else None for d in birth_dates]
+
@@ -0,0 +1,30 @@
+# coding: utf-8
+
+'''
+Helpers for the web scraping and crawling lectures.
+
+01_web_scraping_with_python.py and 02_web_crawling_with_python.py fetch and
+parse pages one at a time. The modules in this folder do the same things at
+scale. Run your scripts from the 07_webscraping folder so `import crawler`
+works.
+'''
+
+from crawler.adaptive import AdaptiveLimiter
+from crawler.cache import CacheMiss, HTTPCache
+from crawler.changes import (UNCHANGED, ChangeTracker, DeltaWriter,
+                             only_changed)
+from crawler.dates import extract_dates, parse_date
+from crawler.fetch import HostLimiter, Page, crawl, fetch_url
+from crawler.fixtures import FixtureSite
+from crawler.frontier import (Frontier, by_anchor, by_depth, by_url, combine,
+                              extract_links, normalize_url)
+from crawler.infobox import Field, extract_infobox
+from crawler.links import LinkScanner, iter_links, page_links, stream_links
+from crawler.metrics import CrawlMetrics
+from crawler.pipeline import Pipeline, pipeline
+from crawler.robots import PoliteScheduler, RobotsCache, RobotsDisallowed
+from crawler.sharded import ShardedCrawler, WorkerError, shard_of
+from crawler.simhash import (NearDuplicate, SimHashIndex, simhash,
+                             skip_near_duplicates)
+from crawler.tables import extract_table, table_to_dataframe
+from crawler.warc import WARCWriter, iter_pages, reparse
@@ -0,0 +1,163 @@
+# coding: utf-8
+
+'''
+Let each host's concurrency find its own level.
+
+HostLimiter allows a fixed number of requests per host: too few and a fast
+site is crawled slowly, too many and a slow site starts answering 429 Too
+Many Requests. AdaptiveLimiter adjusts the number per host the way TCP
+adjusts its sending rate ("AIMD"): while responses come back quickly and
+without errors the limit grows by about one request per round of requests
+(additive increase); a 429, a 5xx, a network error or a response much slower
+than usual cuts it in half (multiplicative decrease). The limit then settles
+around what each site can take.
+
+It learns from the responses through a wrapped fetcher:
+
+    limiter = AdaptiveLimiter()
+    crawl(urls, parse, limiter=limiter, fetcher=limiter.wrap(fetch_url))
+'''
+
+import time
+from email.utils import parsedate_to_datetime
+
+from crawler.fetch import HostLimiter, host_of
+
+
+def retry_after_seconds(value):
+    '''
+    Reads a Retry-After header value, which is either a number of seconds
+    or an HTTP date. Returns None when it is missing or unreadable.
+    '''
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class _HostState(object):
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.latency = None
+        self.samples = 0
+        self.last_cut = 0.0
+        self.ok = 0
+        self.throttled = 0
+        self.errors = 0
+        self.slow = 0
+
+
+class AdaptiveLimiter(HostLimiter):
+    '''
+    A HostLimiter whose per-host limit moves between `min_limit` and
+    `max_limit`, starting at `start`. A response counts as a latency spike
+    when it takes more than `spike_factor` times the host's usual time.
+    After a cut, further bad responses are ignored for `cooldown` seconds,
+    since the requests already in flight were sent at the old rate.
+    '''
+    def __init__(self, start=2, min_limit=1, max_limit=32, delay=0.0,
+                 increase=1.0, decrease=0.5, spike_factor=3.0, cooldown=1.0):
+        HostLimiter.__init__(self, start, delay)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.spike_factor = spike_factor
+        self.cooldown = cooldown
+        self._hosts = {}
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(self.per_host)
+        return state
+
+    def limit_for(self, host):
+        # called by HostLimiter.acquire() with self._cond held
+        return int(self._state(host).limit)
+
+    def record(self, host, status=None, elapsed=None, retry_after=None):
+        '''
+        Reports one finished request: its HTTP status (None for a network
+        error), how long it took and, for a 429 or 503, the Retry-After
+        delay in seconds.
+        '''
+        now = time.time()
+        with self._cond:
+            state = self._state(host)
+            if status is None or status == 429 or status >= 500:
+                if status == 429:
+                    state.throttled += 1
+                else:
+                    state.errors += 1
+                self._cut(state, now)
+                if retry_after:
+                    # nobody starts a request to this host before then
+                    self._next[host] = max(self._next.get(host, 0.0),
+                                           now + retry_after)
+            elif elapsed is not None and state.samples >= 5 and \
+                    elapsed > self.spike_factor * state.latency:
+                state.slow += 1
+                self._cut(state, now)
+            else:
+                state.ok += 1
+                state.limit = min(self.max_limit,
+                                  state.limit + self.increase / state.limit)
+            if elapsed is not None and status is not None and status < 500:
+                # the usual response time, an average that moves slowly
+                if state.latency is None:
+                    state.latency = elapsed
+                else:
+                    state.latency = 0.9 * state.latency + 0.1 * elapsed
+                state.samples += 1
+            self._cond.notify_all()
+
+    def _cut(self, state, now):
+        if now - state.last_cut < self.cooldown:
+            return
+        state.limit = max(self.min_limit, state.limit * self.decrease)
+        state.last_cut = now
+
+    def wrap(self, fetcher):
+        '''
+        Returns a fetcher that reports every response to the limiter; pass
+        it to crawl() together with the limiter itself.
+        '''
+        def adaptive_fetcher(url, **kwargs):
+            host = host_of(url)
+            started = time.time()
+            try:
+                page = fetcher(url, **kwargs)
+            except Exception:
+                self.record(host, None, time.time() - started)
+                raise
+            self.record(host, page.status, page.elapsed or
+                        time.time() - started,
+                        retry_after_seconds(page.headers.get("retry-after")))
+            return page
+        return adaptive_fetcher
+
+    def limits(self):
+        '''The current limit of every host seen so far.'''
+        with self._cond:
+            return dict((host, int(state.limit))
+                        for host, state in self._hosts.items())
+
+    def metrics(self):
+        '''Per-host limit, usual latency and response counts.'''
+        with self._cond:
+            return dict((host, {"limit": int(state.limit),
+                                "active": self._active.get(host, 0),
+                                "latency": state.latency,
+                                "ok": state.ok,
+                                "throttled": state.throttled,
+                                "errors": state.errors,
+                                "slow": state.slow})
+                        for host, state in self._hosts.items())
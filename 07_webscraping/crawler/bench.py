@@ -0,0 +1,232 @@
+# coding: utf-8
+
+'''
+Time the crawler and the extractors against the fixture site.
+
+    python -m crawler.bench                     # everything, 500 pages
+    python -m crawler.bench --pages 2000 --latency 0.05 --only crawl,pipeline
+    python -m crawler.bench --json before.json  # save the numbers to compare
+
+Each benchmark runs in its own process, so it starts from the same state and
+its numbers are its own. For every benchmark it reports pages per second,
+CPU time per page (user + system, including any worker processes) and the
+peak memory use (RSS). The fixture site runs in the main process, so serving
+the pages is not counted. Uses the `resource` module, so Linux or macOS only.
+
+The fixture site itself serves a few hundred pages per second at most, so
+for fetch, crawl and pipeline compare CPU per page, or add --latency to make
+the site behave more like a real one.
+'''
+
+import argparse
+import collections
+import json
+import multiprocessing
+import resource
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+from crawler.fetch import crawl, fetch_url
+from crawler.fixtures import FixtureSite
+from crawler.frontier import extract_links
+from crawler.infobox import PARSER, extract_infobox
+from crawler.links import page_links
+from crawler.pipeline import pipeline
+from crawler.tables import extract_table
+
+ARTICLES = r"^/wiki/[^:]+$"
+
+
+class SiteAddress(collections.namedtuple("SiteAddress",
+                                         ["base_url", "pages"])):
+    '''
+    Where a running FixtureSite is, with its url() and people(). This is
+    what the benchmark processes get: the site itself holds a socket and a
+    lock, which cannot be pickled for a process started with "spawn" (the
+    default on macOS) or "forkserver".
+    '''
+    def url(self, path):
+        return self.base_url + path
+
+    def people(self, n=None):
+        return [self.url("/wiki/Person_%d" % i)
+                for i in range(self.pages if n is None else n)]
+
+
+def birth_date(page):
+    # top level so the pipeline's worker processes can use it
+    return extract_infobox(page.body)["birth_date"]
+
+
+def _bodies(site, n):
+    return crawl(site.people(n), max_workers=16, per_host=16)
+
+
+def bench_fetch(site, n):
+    '''crawl() without parsing: how fast the network side is.'''
+    crawl(site.people(n), max_workers=16, per_host=16)
+    return n
+
+
+def bench_crawl(site, n):
+    '''crawl() with the infobox extractor, all in threads.'''
+    crawl(site.people(n), parse=birth_date, max_workers=16, per_host=16)
+    return n
+
+
+def bench_pipeline(site, n):
+    '''pipeline(): fetching in threads, the infobox extractor in processes.'''
+    for _ in pipeline(site.people(n), birth_date, fetchers=16, per_host=16):
+        pass
+    return n
+
+
+def bench_infobox_soup(pages):
+    '''The lecture's way: parse the whole page, then find the vcard.'''
+    for page in pages:
+        soup = BeautifulSoup(page.body, PARSER)
+        soup.find("table", class_="vcard").find("span", class_="bday")
+    return len(pages)
+
+
+def bench_infobox(pages):
+    '''extract_infobox() on the same pages.'''
+    for page in pages:
+        extract_infobox(page.body)
+    return len(pages)
+
+
+def bench_links_soup(pages):
+    '''BeautifulSoup + extract_links() over the pages.'''
+    for page in pages:
+        extract_links(BeautifulSoup(page.body, PARSER), page.url, ARTICLES)
+    return len(pages)
+
+
+def bench_links(pages):
+    '''The streaming link scanner over the same pages.'''
+    for page in pages:
+        page_links(page, ARTICLES)
+    return len(pages)
+
+
+def bench_table(site, n):
+    '''extract_table() on the country list, n times.'''
+    body = fetch_url(site.url("/wiki/List_of_countries")).body
+    for _ in range(n):
+        soup = BeautifulSoup(body, PARSER)
+        extract_table(soup.find("table", class_="wikitable"), links=True)
+    return n
+
+
+# (name, function, what it works on: the site or fetched pages, share of n)
+BENCHMARKS = [
+    ("fetch", bench_fetch, "site", 1.0),
+    ("crawl", bench_crawl, "site", 1.0),
+    ("pipeline", bench_pipeline, "site", 1.0),
+    ("infobox_soup", bench_infobox_soup, "pages", 1.0),
+    ("infobox", bench_infobox, "pages", 1.0),
+    ("links_soup", bench_links_soup, "pages", 1.0),
+    ("links", bench_links, "pages", 1.0),
+    ("table", bench_table, "site", 0.02),
+]
+
+
+def _cpu(usage):
+    return usage.ru_utime + usage.ru_stime
+
+
+def _run_one(function, works_on, site, n, conn):
+    # runs in a fresh process; fetch the pages first so only the
+    # extraction is timed
+    if works_on == "pages":
+        arg = [page for page in _bodies(site, n)
+               if not isinstance(page, Exception)]
+    else:
+        arg = site
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.time()
+    count = function(arg) if works_on == "pages" else function(arg, n)
+    seconds = time.time() - started
+    own_after = resource.getrusage(resource.RUSAGE_SELF)
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (_cpu(own_after) - _cpu(own) +
+           _cpu(children_after) - _cpu(children))
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024.0 * 1024 if sys.platform == "darwin" else 1024.0
+    peak = max(own_after.ru_maxrss, children_after.ru_maxrss) / scale
+    conn.send({"pages": count,
+               "seconds": seconds,
+               "pages_per_second": count / seconds if seconds else None,
+               "cpu_ms_per_page": 1000.0 * cpu / count if count else None,
+               "peak_rss_mb": peak})
+    conn.close()
+
+
+def run(site, pages=500, only=None):
+    '''
+    Runs the benchmarks (all, or the names in `only`) against a started
+    FixtureSite and returns {name: results}.
+    '''
+    address = SiteAddress(site.base_url, site.pages)
+    results = {}
+    for name, function, works_on, share in BENCHMARKS:
+        if only and name not in only:
+            continue
+        n = max(1, int(pages * share))
+        parent, child = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(
+            target=_run_one, args=(function, works_on, address, n, child))
+        process.start()
+        child.close()
+        results[name] = parent.recv()
+        process.join()
+    return results
+
+
+def format_results(results):
+    lines = ["%-14s %7s %8s %10s %12s %9s" % (
+        "benchmark", "pages", "seconds", "pages/s", "CPU ms/page",
+        "peak MB")]
+    for name, r in results.items():
+        lines.append("%-14s %7d %8.2f %10.1f %12.2f %9.1f" % (
+            name, r["pages"], r["seconds"], r["pages_per_second"] or 0,
+            r["cpu_ms_per_page"] or 0, r["peak_rss_mb"]))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the crawler against a local fixture site.")
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--page-kb", type=int, default=0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--countries", type=int, default=2000)
+    parser.add_argument("--only", help="comma-separated benchmark names: " +
+                        ", ".join(b[0] for b in BENCHMARKS))
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    site = FixtureSite(pages=args.pages, countries=args.countries,
+                       latency=args.latency, jitter=args.jitter,
+                       page_kb=args.page_kb,
+                       failure_rate=args.failure_rate).start()
+    try:
+        only = args.only.split(",") if args.only else None
+        results = run(site, args.pages, only)
+    finally:
+        site.stop()
+    print(format_results(results))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "results": results}, f,
+                      indent=2)
+
+
+if __name__ == "__main__":
+    main()
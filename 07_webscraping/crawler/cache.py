@@ -0,0 +1,125 @@
+# coding: utf-8
+
+'''
+An on-disk HTTP cache for scraping scripts.
+
+Every run of the lecture scripts downloads the same Wikipedia pages again.
+HTTPCache keeps each page's body on disk together with its `ETag` and
+`Last-Modified` headers. The next time the page is requested it sends a
+conditional request; if the server answers 304 (Not Modified) the cached
+bytes are reused and no body is downloaded. With offline=True the cache never
+touches the network, which is what you want while working on a parser.
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from crawler.fetch import Page, fetch_url
+
+
+class CacheMiss(LookupError):
+    '''Raised in offline mode for a URL that is not in the cache.'''
+
+
+class HTTPCache(object):
+    '''
+    Use `cache.fetch(url)` wherever you would call fetch_url(url); it returns
+    the same Page. Only 200 responses are stored.
+
+    `max_age` (seconds) serves cached pages younger than that without asking
+    the server at all. `offline` serves only from the cache.
+    '''
+    def __init__(self, directory="http_cache", offline=False, max_age=None,
+                 fetcher=fetch_url):
+        self.directory = directory
+        self.offline = offline
+        self.max_age = max_age
+        self.fetcher = fetcher
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _paths(self, url):
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.directory, name[:2], name)
+        return base + ".body", base + ".json"
+
+    def _write(self, path, data):
+        # write to a temporary file and rename, so a crash never leaves a
+        # half-written entry behind
+        folder = os.path.dirname(path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=folder)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def load(self, url):
+        '''Returns (meta, body) for a cached URL, or (None, None).'''
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except (IOError, OSError, ValueError):
+            return None, None
+        return meta, body
+
+    def store(self, url, page):
+        body_path, meta_path = self._paths(url)
+        meta = {"url": url, "final_url": page.url, "headers": page.headers,
+                "stored": time.time()}
+        # body first: metadata without a body counts as not cached
+        self._write(body_path, page.body)
+        self._write(meta_path, json.dumps(meta).encode("utf-8"))
+
+    def _cached_page(self, meta, body):
+        return Page(meta["final_url"], 200, meta["headers"], body, 0.0)
+
+    def fetch(self, url):
+        meta, body = self.load(url)
+        if meta is not None:
+            age = time.time() - meta["stored"]
+            if self.offline or (self.max_age is not None
+                                and age < self.max_age):
+                self._count("hits")
+                return self._cached_page(meta, body)
+        elif self.offline:
+            raise CacheMiss(url)
+
+        headers = {}
+        if meta is not None:
+            if "etag" in meta["headers"]:
+                headers["If-None-Match"] = meta["headers"]["etag"]
+            if "last-modified" in meta["headers"]:
+                headers["If-Modified-Since"] = meta["headers"]["last-modified"]
+        page = self.fetcher(url, headers=headers)
+
+        if page.status == 304 and meta is not None:
+            # unchanged: keep the body, refresh the stored time and headers
+            self._count("revalidated")
+            for name in ("etag", "last-modified", "date", "expires",
+                         "cache-control"):
+                if name in page.headers:
+                    meta["headers"][name] = page.headers[name]
+            meta["stored"] = time.time()
+            self._write(self._paths(url)[1], json.dumps(meta).encode("utf-8"))
+            return self._cached_page(meta, body)
+
+        self._count("misses")
+        if page.status == 200:
+            self.store(url, page)
+        return page
@@ -0,0 +1,162 @@
+# coding: utf-8
+
+'''
+Skip pages that have not changed since the last crawl.
+
+Re-scraping the diversity table and the winner pages every week re-parses
+every page even though most of them are exactly as they were. ChangeTracker
+stores a hash of each page's main content -- on Wikipedia the
+`mw-content-text` block, without the comments that carry render timestamps
+-- and on the next crawl only pages whose hash changed are parsed again.
+The results can be written as a changes-only "delta" file.
+'''
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+# where the article text starts and ends on a Wikipedia page
+CONTENT_START = re.compile(rb'<div[^>]*\bid="mw-content-text"')
+CONTENT_END = re.compile(rb'<div[^>]*\b(?:class="printfooter"|id="catlinks")')
+
+COMMENT = re.compile(rb"<!--.*?-->", re.S)
+SPACE = re.compile(rb"\s+")
+
+
+class Unchanged(object):
+    '''The result crawl() gets for a page that has not changed.'''
+    def __repr__(self):
+        return "UNCHANGED"
+
+
+UNCHANGED = Unchanged()
+
+
+def main_content(body):
+    '''
+    The `mw-content-text` region of a page as bytes, or the whole page if
+    it has none.
+    '''
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    start = CONTENT_START.search(body)
+    if start is not None:
+        end = CONTENT_END.search(body, start.end())
+        body = body[start.start():end.start() if end else len(body)]
+    return body
+
+
+def content_hash(body):
+    '''
+    Hashes the main content of a page (see main_content()) with HTML
+    comments removed and whitespace collapsed, so cosmetic differences do
+    not count as changes.
+    '''
+    body = SPACE.sub(b" ", COMMENT.sub(b"", main_content(body))).strip()
+    return hashlib.sha256(body).hexdigest()
+
+
+class ChangeTracker(object):
+    '''
+    Content hashes per URL, kept in a SQLite file between crawls.
+
+    changed(url, body) tells whether a page differs from the stored version;
+    remember(url, digest) stores the new version. Call remember() only after
+    the page has been processed, so a page whose processing failed is
+    treated as changed again next time.
+    '''
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                hash TEXT NOT NULL,
+                first_seen REAL NOT NULL,
+                last_changed REAL NOT NULL,
+                last_checked REAL NOT NULL
+            )''')
+        self._lock = threading.Lock()
+
+    def stored_hash(self, url):
+        with self._lock:
+            row = self.conn.execute("SELECT hash FROM pages WHERE url = ?",
+                                    (url,)).fetchone()
+        return row[0] if row else None
+
+    def changed(self, url, body):
+        '''
+        Returns (status, digest): status is "new", "changed" or
+        "unchanged". Unchanged pages are marked as checked.
+        '''
+        digest = content_hash(body)
+        old = self.stored_hash(url)
+        if old is None:
+            return "new", digest
+        if old != digest:
+            return "changed", digest
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE pages SET last_checked = ? "
+                              "WHERE url = ?", (time.time(), url))
+        return "unchanged", digest
+
+    def remember(self, url, digest):
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO pages (url, hash, first_seen, last_changed, "
+                "last_checked) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET hash = excluded.hash, "
+                "last_changed = excluded.last_changed, "
+                "last_checked = excluded.last_checked",
+                (url, digest, now, now, now))
+
+    def close(self):
+        self.conn.close()
+
+
+def only_changed(tracker, parse, delta=None):
+    '''
+    Wraps a crawl() parse function so it only runs for new or changed pages;
+    unchanged pages get UNCHANGED as their result. If `delta` (a DeltaWriter)
+    is given, every new or changed page's result is written to it.
+    '''
+    def parse_if_changed(page):
+        status, digest = tracker.changed(page.url, page.body)
+        if status == "unchanged":
+            return UNCHANGED
+        result = parse(page)
+        if delta is not None:
+            delta.write(page.url, status, result)
+        tracker.remember(page.url, digest)
+        return result
+    return parse_if_changed
+
+
+class DeltaWriter(object):
+    '''
+    Writes one JSON line per new or changed page:
+    {"url": ..., "change": "new" or "changed", "data": ..., "time": ...}.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a")
+        self._lock = threading.Lock()
+
+    def write(self, url, change, data):
+        line = json.dumps({"url": url, "change": change, "data": data,
+                           "time": time.time()}, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,140 @@
+# coding: utf-8
+
+'''
+Fetch many pages at once, politely.
+
+The crawling lecture calls urlopen() and BeautifulSoup() for one winner page
+after another, so almost all the time is spent waiting for Wikipedia to
+answer. crawl() keeps several requests in flight with a thread pool, but
+never more than `per_host` at a time to the same host, and hands back the
+parsed results in the same order as the input URLs.
+'''
+
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+
+USER_AGENT = "PS239T-crawler/1.0 (course project; python-urllib)"
+
+# what a fetch returns: the final URL, HTTP status, headers (a dict with
+# lower-case names), the raw body and how long it took
+Page = namedtuple("Page", ["url", "status", "headers", "body", "elapsed"])
+
+
+def host_of(url):
+    return urlsplit(url).netloc.lower()
+
+
+def fetch_url(url, timeout=30, headers=None):
+    '''
+    Downloads `url` with urllib and returns a Page. HTTP errors (404, 500...)
+    come back as a Page with that status; network errors raise URLError.
+    '''
+    request_headers = {"User-Agent": USER_AGENT}
+    request_headers.update(headers or {})
+    started = time.time()
+    try:
+        response = urlopen(Request(url, headers=request_headers),
+                           timeout=timeout)
+    except HTTPError as e:
+        response = e
+    with response:
+        body = response.read()
+        return Page(response.geturl() or url, response.getcode(),
+                    dict((k.lower(), v) for k, v in response.headers.items()),
+                    body, time.time() - started)
+
+
+class HostLimiter(object):
+    '''
+    Allows at most `per_host` requests in flight to each host, spaced at
+    least `delay` seconds apart. Use it as `with limiter.slot(host): ...`.
+    '''
+    def __init__(self, per_host=2, delay=0.0):
+        self.per_host = per_host
+        self.delay = delay
+        self._active = {}
+        self._next = {}
+        self._cond = threading.Condition()
+
+    def limit_for(self, host):
+        return self.per_host
+
+    def delay_for(self, host):
+        return self.delay
+
+    def acquire(self, host):
+        with self._cond:
+            while self._active.get(host, 0) >= self.limit_for(host):
+                self._cond.wait()
+            self._active[host] = self._active.get(host, 0) + 1
+            # reserve the next start time for this host
+            now = time.time()
+            start = max(now, self._next.get(host, 0.0))
+            self._next[host] = start + self.delay_for(host)
+        if start > now:
+            time.sleep(start - now)
+
+    def release(self, host):
+        with self._cond:
+            self._active[host] -= 1
+            self._cond.notify_all()
+
+    def active(self, host):
+        with self._cond:
+            return self._active.get(host, 0)
+
+    def slot(self, host):
+        return _Slot(self, host)
+
+
+class _Slot(object):
+    def __init__(self, limiter, host):
+        self.limiter = limiter
+        self.host = host
+
+    def __enter__(self):
+        self.limiter.acquire(self.host)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.limiter.release(self.host)
+
+
+def crawl(urls, parse=None, max_workers=16, per_host=2, delay=0.0,
+          fetcher=fetch_url, limiter=None, metrics=None):
+    '''
+    Fetches every URL in `urls` with up to `max_workers` threads and returns
+    one result per URL, in input order.
+
+    `parse(page)` turns each Page into a result (by default the Page itself
+    is returned). If fetching or parsing a URL raises an exception, the
+    exception object takes its place in the results, so one bad page does
+    not stop the crawl. `fetcher(url)` can be swapped, e.g. for a cache.
+    If `metrics` (a CrawlMetrics) is given, every fetch and parse is timed.
+    '''
+    limiter = limiter or HostLimiter(per_host, delay)
+    if metrics is not None:
+        fetcher = metrics.wrap_fetcher(fetcher)
+        if parse is not None:
+            parse = metrics.wrap_parse(parse)
+
+    def work(url):
+        with limiter.slot(host_of(url)):
+            page = fetcher(url)
+        # parse outside the slot so the host can serve the next request
+        return parse(page) if parse is not None else page
+
+    def safe_work(url):
+        try:
+            return work(url)
+        except Exception as e:
+            return e
+
+    urls = list(urls)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(safe_work, urls))
@@ -0,0 +1,317 @@
+# coding: utf-8
+
+'''
+A fake Wikipedia on your own computer, for testing and timing the crawler.
+
+Crawling the real Wikipedia to see whether a change made the crawler faster
+is slow, impolite and never gives the same numbers twice. FixtureSite serves
+generated pages that look like the ones the lectures scrape:
+
+    /wiki/Turing_Award        a `wikitable sortable` of winners
+    /wiki/List_of_countries   a long `wikitable sortable` of countries
+    /wiki/Person_<n>          an article with a `vcard` infobox and links to
+                              other people, so the pages form a deep graph
+    /robots.txt
+
+Every response can be delayed (`latency`, plus up to `jitter` random extra
+seconds), pages can be padded to `page_kb` kilobytes, and a share of the
+requests can fail with a 500 (`failure_rate`) or a 429 (`throttle_rate`).
+The same `seed` always gives the same pages.
+
+    site = FixtureSite(pages=500, latency=0.05).start()
+    birth_list = crawl(site.people(), parse=get_birth)
+    site.stop()
+
+Or run it on its own with `python -m crawler.fixtures --port 8000`.
+'''
+
+import argparse
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SCHOOLS = ("Harvard University", "Stanford University", "University of "
+           "Cambridge", "Massachusetts Institute of Technology",
+           "University of California, Berkeley", "Princeton University")
+
+FILLER = ("<p>Lorem ipsum dolor sit amet, <b>consectetur</b> adipiscing "
+          "elit, sed do eiusmod tempor <i>incididunt</i> ut labore et dolore "
+          "magna aliqua. Ut enim ad minim veniam, quis nostrud exercitation "
+          "ullamco laboris nisi ut aliquip ex ea commodo consequat.</p>\n")
+
+PAGE = '''<!DOCTYPE html>
+<html lang="en"><head><meta charset="UTF-8"><title>%(title)s - Wikipedia</title>
+<script>var wgPageName = "%(title)s";</script></head>
+<body><div id="content"><h1 id="firstHeading">%(title)s</h1>
+<div id="bodyContent"><div id="mw-content-text" class="mw-body-content">
+%(body)s
+</div><div class="printfooter">Retrieved from
+"<a href="/wiki/%(title)s">/wiki/%(title)s</a>"</div>
+<div id="catlinks"><a href="/wiki/Help:Category">Categories</a>:
+<a href="/wiki/Category:Fixtures">Fixtures</a></div></div></div>
+<!-- NewPP limit report, rendered at @RENDERED@ -->
+</body></html>
+'''
+
+
+class FixtureSite(object):
+    '''
+    Generated Wikipedia-like pages served over HTTP on 127.0.0.1. `pages`
+    people, each linking to `links_per_page` others; `countries` rows in
+    the country list. start() serves them from a background thread.
+    '''
+    def __init__(self, pages=1000, links_per_page=20, countries=200,
+                 latency=0.0, jitter=0.0, page_kb=0, failure_rate=0.0,
+                 throttle_rate=0.0, crawl_delay=None, seed=0, port=0):
+        self.pages = pages
+        self.links_per_page = links_per_page
+        self.countries = countries
+        self.latency = latency
+        self.jitter = jitter
+        self.page_kb = page_kb
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.crawl_delay = crawl_delay
+        self.seed = seed
+        self.port = port
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._cache = {}
+
+    # --- the pages ---
+
+    def _padding(self, html):
+        if not self.page_kb:
+            return ""
+        missing = self.page_kb * 1024 - len(html)
+        return FILLER * max(0, missing // len(FILLER) + 1)
+
+    def _render(self, title, body):
+        html = PAGE % {"title": title, "body": body}
+        return html.replace("</div><div class=\"printfooter\">",
+                            self._padding(html) +
+                            "</div><div class=\"printfooter\">", 1)
+
+    def person(self, n):
+        '''The article of person n: infobox, some text and links.'''
+        rng = random.Random("%s-%d" % (self.seed, n))
+        born = date(1900, 1, 1) + timedelta(days=rng.randrange(365 * 80))
+        died = born + timedelta(days=rng.randrange(365 * 40, 365 * 95))
+        rows = ['<tr><th colspan="2" class="infobox-above">Person %d</th>'
+                '</tr>' % n,
+                '<tr><th scope="row">Born</th><td>Person %d<br>'
+                '<span style="display:none">(<span class="bday">%s</span>)'
+                '</span>%s<br>Springfield</td></tr>'
+                % (n, born.isoformat(), born.strftime("%B %d, %Y")
+                   .replace(" 0", " "))]
+        if died.year < 2020:
+            rows.append('<tr><th scope="row">Died</th><td>%s (aged %d)'
+                        '</td></tr>' % (died.strftime("%B %d, %Y")
+                                        .replace(" 0", " "),
+                                        (died - born).days // 365))
+        school = rng.choice(SCHOOLS)
+        rows.append('<tr><th scope="row">Alma mater</th><td><a href="/wiki/'
+                    '%s">%s</a></td></tr>' % (school.replace(" ", "_"),
+                                              school))
+        infobox = ('<table class="infobox biography vcard"><tbody>%s'
+                   '</tbody></table>' % "".join(rows))
+        links = " ".join('<a href="/wiki/Person_%d" title="Person %d">'
+                         'Person %d</a>' % (m, m, m)
+                         for m in self._neighbours(n, rng))
+        body = ('%s\n<p><b>Person %d</b> was a computer scientist.</p>\n'
+                '<h2><span class="mw-headline">Career</span></h2>\n'
+                '<p>Worked with %s.</p>\n<p><a href="#Career">Career</a> '
+                '<a href="/wiki/Special:Random">Random</a> <a href="https://'
+                'example.org/ref">ref</a></p>' % (infobox, n, links))
+        return self._render("Person_%d" % n, body)
+
+    def _neighbours(self, n, rng):
+        # a few close neighbours plus random long links, so every page is
+        # reachable and the graph is several levels deep
+        close = [(n + 1) % self.pages, (n * 2 + 1) % self.pages]
+        far = [rng.randrange(self.pages)
+               for _ in range(max(0, self.links_per_page - len(close)))]
+        return close + far
+
+    def award_table(self):
+        '''The list of winners, each linking to a person page.'''
+        rows = ['<tr><th>Year</th><th>Recipient</th><th>Rationale</th></tr>']
+        for n in range(self.pages):
+            rows.append('<tr><td>%d</td><td><a href="/wiki/Person_%d" '
+                        'title="Person %d">Person %d</a></td><td>For '
+                        'contributions to topic %d.</td></tr>'
+                        % (1966 + n // 3, n, n, n, n))
+        table = ('<table class="wikitable sortable"><tbody>%s</tbody>'
+                 '</table>' % "\n".join(rows))
+        return self._render("Turing_Award", table)
+
+    def country_table(self):
+        '''A big wikitable like the diversity list in the scraping lecture.'''
+        rng = random.Random("%s-countries" % self.seed)
+        rows = ['<tr><th>Country</th><th>Ethnic fractionalization</th>'
+                '<th>Cultural diversity</th></tr>']
+        for n in range(self.countries):
+            rows.append('<tr><td><span class="flagicon"></span> <a href="/'
+                        'wiki/Country_%d" title="Country %d">Country %d</a>'
+                        '</td><td>%.3f</td><td>%.3f</td></tr>'
+                        % (n, n, n, rng.random(), rng.random()))
+        table = ('<table class="wikitable sortable"><tbody>%s</tbody>'
+                 '</table>' % "\n".join(rows))
+        return self._render("List_of_countries", table)
+
+    def robots(self):
+        lines = ["User-agent: *", "Disallow: /w/"]
+        if self.crawl_delay is not None:
+            lines.append("Crawl-delay: %d" % self.crawl_delay)
+        return "\n".join(lines) + "\n"
+
+    def page(self, path):
+        '''
+        Returns (status, content type, text) for a path. Pages are made once
+        and then kept, apart from the render time in an HTML comment (which
+        changes on every request, like on Wikipedia).
+        '''
+        cached = self._cache.get(path)
+        if cached is None:
+            cached = self._cache[path] = self._make_page(path)
+        status, kind, text = cached
+        return status, kind, text.replace("@RENDERED@", repr(time.time()))
+
+    def _make_page(self, path):
+        if path == "/robots.txt":
+            return 200, "text/plain", self.robots()
+        if path == "/wiki/Turing_Award":
+            return 200, "text/html", self.award_table()
+        if path == "/wiki/List_of_countries":
+            return 200, "text/html", self.country_table()
+        if path.startswith("/wiki/Person_"):
+            try:
+                n = int(path[len("/wiki/Person_"):])
+            except ValueError:
+                n = -1
+            if 0 <= n < self.pages:
+                return 200, "text/html", self.person(n)
+        return 404, "text/html", self._render("Not_found", "<p>No such "
+                                              "page.</p>")
+
+    # --- serving ---
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:%d" % self.port
+
+    def url(self, path):
+        return self.base_url + path
+
+    def people(self, n=None):
+        '''URLs of the first `n` person pages (default: all).'''
+        return [self.url("/wiki/Person_%d" % i)
+                for i in range(self.pages if n is None else n)]
+
+    def _decide(self):
+        # how this request should go: "ok", "fail" or "throttle", and delay
+        with self._lock:
+            self.requests += 1
+            roll = self._random.random()
+            delay = self.latency + self._random.random() * self.jitter
+        if roll < self.failure_rate:
+            return "fail", delay
+        if roll < self.failure_rate + self.throttle_rate:
+            return "throttle", delay
+        return "ok", delay
+
+    def _handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                outcome, delay = site._decide()
+                if delay:
+                    time.sleep(delay)
+                path = self.path.split("?")[0]
+                headers = {}
+                if outcome == "fail" and path != "/robots.txt":
+                    status, kind, text = 500, "text/plain", "server error"
+                elif outcome == "throttle" and path != "/robots.txt":
+                    status, kind, text = 429, "text/plain", "slow down"
+                    headers["Retry-After"] = "1"
+                else:
+                    status, kind, text = site.page(path)
+                body = text.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", kind + "; charset=UTF-8")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _listen(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", self.port),
+                                           self._handler())
+        self._server.daemon_threads = True
+        # port 0 means "any free port"; remember which one we got
+        self.port = self._server.server_address[1]
+
+    def start(self):
+        '''Starts serving in a background thread; returns the site.'''
+        self._listen()
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def serve_forever(self):
+        self._listen()
+        self._server.serve_forever()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve generated Wikipedia-like pages on 127.0.0.1.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--links", type=int, default=20)
+    parser.add_argument("--countries", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--page-kb", type=int, default=0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    site = FixtureSite(args.pages, args.links, args.countries, args.latency,
+                       args.jitter, args.page_kb, args.failure_rate,
+                       args.throttle_rate, seed=args.seed, port=args.port)
+    print("serving on http://127.0.0.1:%d/wiki/Turing_Award" % args.port)
+    try:
+        site.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+# coding: utf-8
+
+'''
+A crawl frontier that survives restarts.
+
+The crawling lecture follows one hand-built list of links. A crawl that keeps
+following the links it finds needs to remember which URLs it has already
+seen -- and "/wiki/Alan_Perlis", "https://en.wikipedia.org/wiki/Alan_Perlis"
+and "https://EN.wikipedia.org/wiki/Alan_Perlis#Career" are all the same page.
+normalize_url() turns every link into one canonical absolute form. Frontier
+keeps the queue and the seen-set in SQLite, with a Bloom filter in memory in
+front of it: a URL the filter has never seen is new for sure and is inserted
+without checking the database first. A crawl of millions of URLs needs little
+RAM and can stop and pick up where it left off.
+
+By default the queue is first in, first out. For a focused crawl -- say,
+only the biographies reachable from the award lists -- give the Frontier a
+`scorer`: URLs with the highest score are handed out first. Scores can be
+built from the link's depth, its anchor text and the URL itself:
+
+    scorer = combine(by_depth(), by_anchor(r"(?i)award|prize", 2.0),
+                     by_url(r"^https://en\\.wikipedia\\.org/wiki/[^:]+$", 1.0))
+    frontier = Frontier("focused.db", scorer=scorer, max_depth=3,
+                        domain_budget=5000)
+'''
+
+import hashlib
+import math
+import re
+import sqlite3
+import string
+import threading
+import time
+from urllib.parse import quote, urljoin, urlsplit, urlunsplit
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# characters that mean the same escaped or not (RFC 3986, section 2.3)
+UNRESERVED = frozenset(string.ascii_letters + string.digits + "-._~")
+ESCAPE = re.compile(r"%([0-9A-Fa-f]{2})")
+STRAY_PERCENT = re.compile(r"%(?![0-9A-Fa-f]{2})")
+
+
+def _escape(match):
+    char = chr(int(match.group(1), 16))
+    return char if char in UNRESERVED else "%" + match.group(1).upper()
+
+
+def _normalize_escapes(text, safe):
+    # Decoding everything would turn "%26" in a query value into "&" and
+    # "%2F" in a path segment into "/", which changes what the URL means.
+    # Only unreserved characters are decoded; other escapes stay, written
+    # in upper case, and characters that must be escaped are.
+    text = STRAY_PERCENT.sub("%25", text)
+    text = ESCAPE.sub(_escape, text)
+    return quote(text, safe=safe + "%")
+
+
+def normalize_url(url, base=None):
+    '''
+    Returns the canonical absolute form of `url` (resolved against `base`):
+    lower-case scheme and host, no default port, no fragment, "." and ".."
+    segments resolved and percent-escapes written consistently. The path and
+    query keep their case, since most servers (Wikipedia included) treat
+    /wiki/Apple and /wiki/apple as different pages. Returns None for links
+    that are not http(s), such as "mailto:" or "javascript:".
+    '''
+    if base is not None:
+        url = urljoin(base, url.strip())
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+    host = parts.hostname.lower().rstrip(".")
+    try:
+        port = parts.port
+    except ValueError:
+        return None
+    if port is not None and port != DEFAULT_PORTS[scheme]:
+        host = "%s:%d" % (host, port)
+    if parts.username:
+        return None
+    # so "%7e", "%7E" and "~" end up the same; "%2E%2E" becomes ".." before
+    # the dot segments are resolved
+    path = _normalize_escapes(parts.path, "/:@!$&'()*+,;=-._~")
+    path = urljoin("/", path) if path else "/"
+    query = _normalize_escapes(parts.query, "=&/:@!$'()*+,;-._~?")
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def extract_links(soup, base_url, pattern=None, anchors=False):
+    '''
+    Collects the normalized links of every <a href> in a parsed page, like
+    the `all_urls_regex` loop in the scraping lecture. `pattern` (a regex)
+    keeps only hrefs that match it, e.g. r"^/wiki/[^:]+$" for articles.
+    With anchors=True it returns (url, anchor text) pairs, which
+    Frontier.add_many() can score.
+    '''
+    if pattern is not None and not hasattr(pattern, "search"):
+        pattern = re.compile(pattern)
+    links = []
+    for a in soup.find_all("a", href=True):
+        href = a.get("href")
+        if pattern is not None and not pattern.search(href):
+            continue
+        url = normalize_url(href, base_url)
+        if url is None:
+            continue
+        if anchors:
+            links.append((url, a.get_text(" ", strip=True)))
+        else:
+            links.append(url)
+    return links
+
+
+def by_depth(weight=1.0):
+    '''Scorer: shallower links first (minus `weight` per level).'''
+    def score(url, depth, anchor):
+        return -weight * depth
+    return score
+
+
+def by_anchor(pattern, weight=1.0):
+    '''Scorer: `weight` for links whose anchor text matches `pattern`.'''
+    pattern = re.compile(pattern)
+
+    def score(url, depth, anchor):
+        return weight if anchor and pattern.search(anchor) else 0.0
+    return score
+
+
+def by_url(pattern, weight=1.0):
+    '''Scorer: `weight` for URLs that match `pattern`.'''
+    pattern = re.compile(pattern)
+
+    def score(url, depth, anchor):
+        return weight if pattern.search(url) else 0.0
+    return score
+
+
+def combine(*scorers):
+    '''Scorer: the sum of several scorers.'''
+    def score(url, depth, anchor):
+        return sum(s(url, depth, anchor) for s in scorers)
+    return score
+
+
+class BloomFilter(object):
+    '''
+    A set that never forgets an item but may wrongly claim to contain one it
+    has not seen, with probability about `error_rate` once `capacity` items
+    have been added. It needs about 1.2 bytes per item at a 1% error rate.
+    '''
+    def __init__(self, capacity=1000000, error_rate=0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = int(math.ceil(-capacity * math.log(error_rate) /
+                                  (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / float(capacity) *
+                                       math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # double hashing: k positions from two halves of one digest
+        digest = hashlib.blake2b(item.encode("utf-8"),
+                                 digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for p in self._positions(item):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[p >> 3] & (1 << (p & 7))
+                   for p in self._positions(item))
+
+
+class Frontier(object):
+    '''
+    URLs to crawl and URLs already seen, stored in a SQLite file.
+
+    add() queues a URL unless it has been seen before; pop() hands out the
+    next queued URLs and done() marks them finished. URLs that were handed
+    out but never finished (because the crawler stopped) are queued again
+    when the frontier is reopened.
+
+    `scorer(url, depth, anchor)` gives each new URL a priority (highest
+    first; without a scorer the queue is first in, first out). URLs deeper
+    than `max_depth` are not queued. `domain_budget` limits how many URLs
+    per host pop() hands out: a number for every host, or a dict of
+    {host: number} for some; URLs of a host over its budget are marked
+    'over_budget' instead.
+    '''
+    def __init__(self, path, capacity=1000000, error_rate=0.01, scorer=None,
+                 max_depth=None, domain_budget=None):
+        self.path = path
+        self.scorer = scorer
+        self.max_depth = max_depth
+        self.domain_budget = domain_budget
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS urls (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL UNIQUE,
+                depth INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'queued',
+                added REAL NOT NULL,
+                priority REAL NOT NULL DEFAULT 0,
+                host TEXT
+            )''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS urls_queue "
+                          "ON urls (status, priority DESC, id)")
+        self._lock = threading.Lock()
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE urls SET status = 'queued' "
+                              "WHERE status = 'in_progress'")
+        self.seen = BloomFilter(capacity, error_rate)
+        for (url,) in self.conn.execute("SELECT url FROM urls"):
+            self.seen.add(url)
+        # URLs handed out per host so far, for the budgets
+        self._spent = dict(self.conn.execute(
+            "SELECT host, COUNT(*) FROM urls WHERE status NOT IN "
+            "('queued', 'over_budget') GROUP BY host"))
+
+    def _budget(self, host):
+        if isinstance(self.domain_budget, dict):
+            return self.domain_budget.get(host)
+        return self.domain_budget
+
+    def add(self, url, depth=0, base=None):
+        '''Queues `url` if it is new. Returns True if it was added.'''
+        return self.add_many([url], depth, base) == 1
+
+    def add_many(self, urls, depth=0, base=None):
+        '''
+        Queues every new URL in `urls`; returns how many were new. Items may
+        also be (url, anchor text) pairs, as extract_links(anchors=True)
+        returns them, for the scorer. A queued URL found again with a higher
+        score moves up the queue.
+        '''
+        if self.max_depth is not None and depth > self.max_depth:
+            return 0
+        now = time.time()
+        added = 0
+        with self._lock, self.conn:
+            for item in urls:
+                url, anchor = item if isinstance(item, tuple) else (item, None)
+                url = normalize_url(url, base)
+                if url is None:
+                    continue
+                score = 0.0
+                if self.scorer is not None:
+                    score = self.scorer(url, depth, anchor)
+                if url not in self.seen:
+                    # never seen for sure: no need to ask the database
+                    self.seen.add(url)
+                    self.conn.execute(
+                        "INSERT INTO urls (url, depth, added, priority, "
+                        "host) VALUES (?, ?, ?, ?, ?)",
+                        (url, depth, now, score, urlsplit(url).netloc))
+                    added += 1
+                    continue
+                # maybe seen: the UNIQUE index on disk is the exact seen-set
+                cur = self.conn.execute(
+                    "INSERT OR IGNORE INTO urls (url, depth, added, priority, "
+                    "host) VALUES (?, ?, ?, ?, ?)",
+                    (url, depth, now, score, urlsplit(url).netloc))
+                if cur.rowcount == 0 and self.scorer is not None:
+                    self.conn.execute(
+                        "UPDATE urls SET priority = ? WHERE url = ? AND "
+                        "status = 'queued' AND priority < ?",
+                        (score, url, score))
+                added += cur.rowcount
+        return added
+
+    def __contains__(self, url):
+        # the Bloom filter answers "never seen" without touching the disk;
+        # only a possible match needs a database lookup
+        url = normalize_url(url)
+        if url is None or url not in self.seen:
+            return False
+        with self._lock:
+            row = self.conn.execute("SELECT 1 FROM urls WHERE url = ?",
+                                    (url,)).fetchone()
+        return row is not None
+
+    def pop(self, n=1):
+        '''
+        Hands out up to `n` queued (url, depth) pairs, highest priority
+        first and oldest first among equals.
+        '''
+        out = []
+        with self._lock, self.conn:
+            while len(out) < n:
+                rows = self.conn.execute(
+                    "SELECT id, url, depth, host FROM urls "
+                    "WHERE status = 'queued' ORDER BY priority DESC, id "
+                    "LIMIT ?", (n - len(out),)).fetchall()
+                if not rows:
+                    break
+                for i, url, depth, host in rows:
+                    budget = self._budget(host)
+                    if budget is not None and \
+                            self._spent.get(host, 0) >= budget:
+                        status = "over_budget"
+                    else:
+                        status = "in_progress"
+                        self._spent[host] = self._spent.get(host, 0) + 1
+                        out.append((url, depth))
+                    self.conn.execute("UPDATE urls SET status = ? "
+                                      "WHERE id = ?", (status, i))
+        return out
+
+    def done(self, url, status="done"):
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE urls SET status = ? WHERE url = ?",
+                              (status, url))
+
+    def counts(self):
+        with self._lock:
+            return dict(self.conn.execute(
+                "SELECT status, COUNT(*) FROM urls GROUP BY status"))
+
+    def __len__(self):
+        '''Number of URLs still waiting to be crawled.'''
+        return self.counts().get("queued", 0)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,104 @@
+# coding: utf-8
+
+'''
+Pull a few fields out of a Wikipedia infobox without parsing the whole page.
+
+The crawling lecture builds a full BeautifulSoup tree of every winner's page
+only to read one row of the `vcard` table. extract_infobox() cuts the raw
+HTML down to the part that contains the infobox (it always comes before the
+first section heading), parses only the infobox table with a SoupStrainer,
+and uses the fast lxml parser when it is installed.
+
+Which fields to read is described by a dict of Field objects, e.g.
+
+    fields = {"born": Field("Born", select="span.bday"),
+              "died": Field("Died")}
+'''
+
+import re
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+
+class Field(object):
+    '''
+    One infobox row. `label` is matched against the row heading (the <th>)
+    as a regular expression. By default the value is the text of the row's
+    <td>; `select` picks a CSS selector inside it instead (e.g. the hidden
+    ISO date in "span.bday"), and `attr` reads an attribute of that element.
+    '''
+    def __init__(self, label, select=None, attr=None):
+        self.label = re.compile(label)
+        self.select = select
+        self.attr = attr
+
+    def read(self, cell):
+        target = cell.select_one(self.select) if self.select else cell
+        if target is None:
+            return None
+        if self.attr:
+            return target.get(self.attr)
+        return target.get_text(" ", strip=True)
+
+
+# what the crawling lecture collects from each Turing Award winner
+WINNER_FIELDS = {"born": Field("Born"),
+                 "birth_date": Field("Born", select="span.bday"),
+                 "died": Field("Died"),
+                 "alma_mater": Field("Alma mater")}
+
+
+def _infobox_slice(html, class_):
+    # from the opening <table> of the infobox to the first section heading
+    start = re.search(r'<table[^>]*class="[^"]*\b%s\b' % re.escape(class_),
+                      html)
+    if start is None:
+        return None
+    end = html.find("<h2", start.start())
+    return html[start.start():end if end != -1 else len(html)]
+
+
+def parse_infobox(html, class_="vcard", parser=PARSER):
+    '''
+    Returns the infobox table of a page (a BeautifulSoup Tag) or None.
+    `html` may be bytes or text.
+    '''
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", "replace")
+    part = _infobox_slice(html, class_)
+    if part is None:
+        return None
+    # match the class with a regex: while parsing, the strainer may see the
+    # whole class attribute ("infobox biography vcard") as one string
+    strainer = SoupStrainer("table", attrs={
+        "class": re.compile(r"\b%s\b" % re.escape(class_))})
+    soup = BeautifulSoup(part, parser, parse_only=strainer)
+    return soup.find("table", class_=class_)
+
+
+def extract_infobox(html, fields=WINNER_FIELDS, class_="vcard",
+                    parser=PARSER):
+    '''
+    Returns a dict with one entry per field in `fields`; fields that are not
+    on the page are None.
+    '''
+    result = dict((name, None) for name in fields)
+    table = parse_infobox(html, class_, parser)
+    if table is None:
+        return result
+    for row in table.find_all("tr"):
+        heading = row.find("th")
+        cell = row.find("td")
+        if heading is None or cell is None:
+            continue
+        label = heading.get_text(" ", strip=True)
+        for name, field in fields.items():
+            if result[name] is None and field.label.search(label):
+                result[name] = field.read(cell)
+    return result
@@ -0,0 +1,205 @@
+# coding: utf-8
+
+'''
+Collect the links of a page without building a BeautifulSoup tree.
+
+The `all_urls` loops in the scraping lecture parse the whole page into a soup
+only to read the `href` of every <a> tag. LinkScanner skips almost all of
+that work: a regular expression jumps from one <a> (or <base>) tag to the
+next, stepping over comments, scripts and styles, and reads only the href.
+Nothing is kept but the links, so it is several times faster than a soup,
+and it can be fed the page in pieces while it downloads. stream_links() does
+exactly that and yields each absolute link as soon as its tag has arrived,
+using the same memory for a page of 10 KB or 10 MB.
+'''
+
+import codecs
+import re
+from html import unescape
+from urllib.parse import urljoin
+from urllib.request import Request, urlopen
+
+from crawler.fetch import USER_AGENT
+from crawler.frontier import normalize_url
+
+# how much of the page to read at a time
+CHUNK_SIZE = 64 * 1024
+
+# where something we care about may start
+TAG_START = re.compile(r"<(?:!--|(?:script|style)\b|(?:a|base)\s)", re.I)
+
+# the complete thing: a comment, a script or style block, or an <a>/<base>
+# tag (quoted attribute values may contain ">")
+TOKEN = re.compile(r'''<!--.*?-->'''
+                   r'''|<(script|style)\b.*?</\1\s*>'''
+                   r'''|<(a|base)\s((?:[^>"']|"[^"]*"|'[^']*')*)>''',
+                   re.I | re.S)
+
+# an <a>/<base> tag ended at the first ">", for tags whose quotes do not
+# balance, such as <a title=it's href="...">
+LOOSE_TAG = re.compile(r"<(a|base)\s([^>]*)>", re.I)
+
+# an <a>/<base> tag that is not complete after this many characters is read
+# with LOOSE_TAG instead of waiting for a closing quote that never comes
+MAX_TAG = 4096
+
+# one attribute: name, then a double-quoted, single-quoted or bare value
+ATTR = re.compile(r'''([^\s=/>]+)'''
+                  r'''(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]*)))?''')
+
+# long enough to hold the start of any TAG_START match
+_TAIL = 8
+
+
+def _href(attrs):
+    for match in ATTR.finditer(attrs):
+        if match.group(1).lower() == "href":
+            value = match.group(2)
+            if value is None:
+                value = match.group(3)
+            if value is None:
+                value = match.group(4) or ""
+            return unescape(value)
+    return None
+
+
+class LinkScanner(object):
+    '''
+    Feed it HTML text with feed() and take the links found so far with
+    pop(); call close() after the last piece. Links are resolved against
+    `base_url` (or the page's <base href>) and normalized with
+    normalize_url(); `pattern` (a regex) keeps only the hrefs that match it,
+    e.g. r"^/wiki/[^:]+$" for Wikipedia articles.
+    '''
+    def __init__(self, base_url, pattern=None, normalize=True):
+        if pattern is not None and not hasattr(pattern, "search"):
+            pattern = re.compile(pattern)
+        self.base_url = base_url
+        self.pattern = pattern
+        self.normalize = normalize
+        self._base_seen = False
+        self._buffer = ""
+        self._found = []
+
+    def feed(self, text):
+        self._buffer += text
+        self._scan(final=False)
+
+    def close(self):
+        self._scan(final=True)
+        self._buffer = ""
+
+    def _scan(self, final):
+        buf = self._buffer
+        pos = 0
+        while True:
+            start = TAG_START.search(buf, pos)
+            if start is None:
+                # keep a few characters in case a tag starts at the very end
+                pos = len(buf) if final else max(pos, len(buf) - _TAIL)
+                break
+            is_tag = start.group(0)[1] in "aAbB"
+            # an <a>/<base> tag longer than MAX_TAG is not waiting for more
+            # text but has a stray quote; without this the rest of the page
+            # would be kept and scanned again on every feed()
+            overlong = is_tag and len(buf) - start.start() > MAX_TAG
+            if is_tag:
+                match = TOKEN.match(buf, start.start(),
+                                    start.start() + MAX_TAG)
+            else:
+                match = TOKEN.match(buf, start.start())
+            if match is not None:
+                tag, attrs = match.group(2), match.group(3)
+            elif is_tag and (final or overlong):
+                match = LOOSE_TAG.match(buf, start.start())
+                if match is not None:
+                    tag, attrs = match.group(1), match.group(2)
+            if match is None:
+                if not final and not overlong:
+                    # unfinished: wait for the next piece
+                    pos = start.start()
+                    break
+                pos = start.start() + 1
+                continue
+            pos = match.end()
+            if tag is None:
+                continue
+            href = _href(attrs)
+            if href is None:
+                continue
+            if tag.lower() == "a":
+                self._add(href)
+            elif not self._base_seen and href:
+                # only the first <base href> counts
+                self.base_url = urljoin(self.base_url, href.strip())
+                self._base_seen = True
+        self._buffer = buf[pos:]
+
+    def _add(self, href):
+        if self.pattern is not None and not self.pattern.search(href):
+            return
+        if self.normalize:
+            url = normalize_url(href, self.base_url)
+        else:
+            url = urljoin(self.base_url, href.strip())
+        if url is not None:
+            self._found.append(url)
+
+    def pop(self):
+        '''Returns the links found since the last pop().'''
+        found, self._found = self._found, []
+        return found
+
+
+def iter_links(chunks, base_url, pattern=None, encoding="utf-8",
+               normalize=True):
+    '''
+    Yields the links in an HTML document that arrives as an iterable of
+    byte (or text) chunks. A character split between two chunks is fine.
+    '''
+    scanner = LinkScanner(base_url, pattern, normalize)
+    decoder = codecs.getincrementaldecoder(encoding)("replace")
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+        scanner.feed(chunk)
+        for url in scanner.pop():
+            yield url
+    scanner.feed(decoder.decode(b"", final=True))
+    scanner.close()
+    for url in scanner.pop():
+        yield url
+
+
+def page_links(page, pattern=None, normalize=True):
+    '''
+    The links of a Page from crawler.fetch, as a list; a drop-in for
+    BeautifulSoup + extract_links() in a crawl() parse function.
+    '''
+    return list(iter_links([page.body], page.url, pattern,
+                           _charset(page.headers.get("content-type")),
+                           normalize))
+
+
+def stream_links(url, pattern=None, chunk_size=CHUNK_SIZE, timeout=30):
+    '''
+    Downloads `url` piece by piece and yields its links while the rest of
+    the page is still arriving.
+    '''
+    request = Request(url, headers={"User-Agent": USER_AGENT})
+    with urlopen(request, timeout=timeout) as response:
+        chunks = iter(lambda: response.read(chunk_size), b"")
+        encoding = _charset(response.headers.get("content-type"))
+        for link in iter_links(chunks, response.geturl() or url, pattern,
+                               encoding):
+            yield link
+
+
+def _charset(content_type):
+    match = re.search(r"charset=[\"']?([\w.:-]+)", content_type or "", re.I)
+    if match:
+        try:
+            return codecs.lookup(match.group(1)).name
+        except LookupError:
+            pass
+    return "utf-8"
@@ -0,0 +1,274 @@
+# coding: utf-8
+
+'''
+Counters and timings for a crawl.
+
+Printing every link tells you that a crawl is running, not why it is slow.
+CrawlMetrics counts pages, bytes and errors (by kind and per host) and keeps
+histograms of how long fetching, parsing and writing take. Compare the three
+to see whether a crawl is waiting for the network, for the CPU or for the
+disk. It can print a one-line summary every few seconds while the crawl
+runs and save everything as JSON when the script ends.
+
+    metrics = CrawlMetrics()
+    metrics.start_progress(10)
+    metrics.dump_at_exit("crawl_metrics.json")
+    results = crawl(urls, parse, metrics=metrics)
+'''
+
+import atexit
+import bisect
+import collections
+import json
+import sys
+import threading
+import time
+
+from crawler.fetch import host_of
+
+# upper bounds (in seconds) of the histogram buckets
+FETCH_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PARSE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class Histogram(object):
+    '''
+    Cumulative histogram in the Prometheus style: counts[i] is the number of
+    observations less than or equal to buckets[i]; the last slot is +Inf.
+    '''
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        out = []
+        for n in self.counts:
+            total += n
+            out.append(total)
+        return out
+
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def to_dict(self):
+        bounds = [str(b) for b in self.buckets] + ["+Inf"]
+        return {"buckets": dict(zip(bounds, self.cumulative())),
+                "count": self.count,
+                "sum": self.sum}
+
+
+def error_class(error=None, status=None):
+    '''"HTTP 404" for an error status, else the exception's class name.'''
+    if error is None:
+        return "HTTP %d" % status
+    return type(error).__name__
+
+
+class CrawlMetrics(object):
+    '''
+    Thread-safe crawl statistics.
+
+    Counters: pages fetched, bytes received, pages parsed, results written
+    and errors (also counted per kind in `errors_by_class`). Histograms:
+    fetch, parse and write times. `hosts` holds pages, bytes, errors and
+    total fetch time per host. Gauges such as queue depths are functions
+    registered with gauge() and read whenever a summary is made.
+    '''
+    def __init__(self, fetch_buckets=FETCH_BUCKETS,
+                 parse_buckets=PARSE_BUCKETS):
+        self.started = time.time()
+        self.pages = 0
+        self.bytes = 0
+        self.parsed = 0
+        self.written = 0
+        self.errors = 0
+        self.errors_by_class = collections.Counter()
+        self.hosts = collections.defaultdict(
+            lambda: {"pages": 0, "bytes": 0, "errors": 0, "seconds": 0.0})
+        self.fetch_latency = Histogram(fetch_buckets)
+        self.parse_latency = Histogram(parse_buckets)
+        self.write_latency = Histogram(parse_buckets)
+        self._gauges = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._progress = None
+
+    def record_fetch(self, host, seconds, nbytes=0, status=200, error=None):
+        '''One finished request; `error` is the exception if it failed.'''
+        with self._lock:
+            stats = self.hosts[host]
+            self.fetch_latency.observe(seconds)
+            stats["seconds"] += seconds
+            if error is None:
+                self.pages += 1
+                self.bytes += nbytes
+                stats["pages"] += 1
+                stats["bytes"] += nbytes
+            if error is not None or status >= 400:
+                self.errors += 1
+                self.errors_by_class[error_class(error, status)] += 1
+                stats["errors"] += 1
+
+    def record_parse(self, seconds, error=None):
+        with self._lock:
+            self.parse_latency.observe(seconds)
+            self.parsed += 1
+            if error is not None:
+                self.errors += 1
+                self.errors_by_class[error_class(error)] += 1
+
+    def record_write(self, seconds, n=1):
+        with self._lock:
+            self.write_latency.observe(seconds)
+            self.written += n
+
+    def gauge(self, name, read):
+        '''Registers `read()`, e.g. a queue's qsize, as gauge `name`.'''
+        self._gauges[name] = read
+
+    def wrap_fetcher(self, fetcher):
+        '''Returns a fetcher that records every request it makes.'''
+        def measured_fetcher(url, **kwargs):
+            started = time.time()
+            try:
+                page = fetcher(url, **kwargs)
+            except Exception as e:
+                self.record_fetch(host_of(url), time.time() - started,
+                                  error=e)
+                raise
+            self.record_fetch(host_of(url), time.time() - started,
+                              len(page.body), page.status)
+            return page
+        return measured_fetcher
+
+    def wrap_parse(self, parse):
+        '''Returns a parse function that records how long each call takes.'''
+        def measured_parse(page):
+            started = time.time()
+            try:
+                result = parse(page)
+            except Exception as e:
+                self.record_parse(time.time() - started, e)
+                raise
+            self.record_parse(time.time() - started)
+            return result
+        return measured_parse
+
+    def timed_write(self):
+        '''
+        Times a block of writing code:
+
+            with metrics.timed_write():
+                f.write(line)
+        '''
+        return _WriteTimer(self)
+
+    def elapsed(self):
+        return time.time() - self.started
+
+    def pages_per_second(self):
+        elapsed = self.elapsed()
+        return self.pages / elapsed if elapsed > 0 else 0.0
+
+    def gauges(self):
+        out = {}
+        for name, read in self._gauges.items():
+            try:
+                out[name] = read()
+            except Exception:
+                out[name] = None
+        return out
+
+    def summary(self):
+        '''One line: totals, rates, mean times, errors and gauges.'''
+        def ms(histogram):
+            value = histogram.mean()
+            return "-" if value is None else "%.1fms" % (value * 1000)
+
+        with self._lock:
+            line = ("%d pages, %.1f pages/s, %.1f MB | fetch %s, parse %s, "
+                    "write %s (mean) | %d errors" % (
+                        self.pages, self.pages_per_second(),
+                        self.bytes / 1e6, ms(self.fetch_latency),
+                        ms(self.parse_latency), ms(self.write_latency),
+                        self.errors))
+        gauges = self.gauges()
+        if gauges:
+            line += " | " + " ".join("%s=%s" % (name, value)
+                                     for name, value in gauges.items())
+        return line
+
+    def to_dict(self):
+        with self._lock:
+            out = {"pages": self.pages,
+                   "bytes": self.bytes,
+                   "parsed": self.parsed,
+                   "written": self.written,
+                   "errors": self.errors,
+                   "errors_by_class": dict(self.errors_by_class),
+                   "fetch_latency_seconds": self.fetch_latency.to_dict(),
+                   "parse_latency_seconds": self.parse_latency.to_dict(),
+                   "write_latency_seconds": self.write_latency.to_dict(),
+                   "hosts": dict((host, dict(stats))
+                                 for host, stats in self.hosts.items())}
+        out["gauges"] = self.gauges()
+        out["elapsed_seconds"] = self.elapsed()
+        out["pages_per_second"] = self.pages_per_second()
+        return out
+
+    def to_json(self, path=None):
+        '''
+        Returns the metrics as a JSON string; also writes them to `path`
+        if one is given.
+        '''
+        text = json.dumps(self.to_dict(), indent=2, default=str)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
+
+    def start_progress(self, interval=10.0, stream=None):
+        '''Prints summary() every `interval` seconds until stop_progress().'''
+        stream = stream or sys.stderr
+        stop = threading.Event()
+
+        def report():
+            while not stop.wait(interval):
+                stream.write(self.summary() + "\n")
+                stream.flush()
+
+        thread = threading.Thread(target=report)
+        thread.daemon = True
+        thread.start()
+        self._progress = stop
+
+    def stop_progress(self):
+        if self._progress is not None:
+            self._progress.set()
+            self._progress = None
+
+    def dump_at_exit(self, path):
+        '''Writes the metrics to `path` as JSON when the script ends.'''
+        def dump():
+            self.stop_progress()
+            self.to_json(path)
+        atexit.register(dump)
+
+
+class _WriteTimer(object):
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def __enter__(self):
+        self.started = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.record_write(time.time() - self.started)
@@ -0,0 +1,246 @@
+# coding: utf-8
+
+'''
+Fetch with threads, parse with processes.
+
+crawl() fetches and parses in the same threads. Fetching mostly waits for the
+network, so threads are fine for it, but BeautifulSoup parsing uses the CPU
+and Python threads take turns on one core while they do that. pipeline()
+splits the work into stages:
+
+    fetcher threads -> bounded queue of pages -> parser processes -> you
+
+The fetcher threads keep the network busy, the parsers run in a process pool
+on every core, and the results come back to the loop that iterates over
+pipeline(), which writes them wherever it likes. All queues have a fixed
+size: when the parsers (or your writing) fall behind, the fetchers wait
+instead of piling up pages in memory.
+'''
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from crawler.fetch import HostLimiter, fetch_url, host_of
+
+# how many pages may wait between the fetchers and the parsers
+QUEUE_SIZE = 64
+
+_DONE = object()
+
+
+class _StageError(object):
+    # sent through the results queue when a stage of the pipeline failed:
+    # iterating over `urls`, or handing pages to the parser processes
+    def __init__(self, error):
+        self.error = error
+
+
+def _parse_page(parse, page):
+    # runs in a parser process; the time is sent back for the metrics
+    started = time.time()
+    try:
+        return parse(page), None, time.time() - started
+    except Exception as e:
+        return None, e, time.time() - started
+
+
+class Pipeline(object):
+    '''
+    A fetch -> parse -> write pipeline. `parse(page)` runs in one of
+    `parsers` worker processes (default: one per CPU), so it must be a
+    function defined at the top level of a module, and what it returns must
+    be picklable. `fetchers` threads download the pages, sharing `limiter`
+    (a HostLimiter) so every host still gets at most `per_host` requests.
+    With a CrawlMetrics as `metrics`, fetch and parse times and the queue
+    depths are recorded too.
+    '''
+    def __init__(self, parse, fetchers=16, parsers=None, per_host=2,
+                 delay=0.0, queue_size=QUEUE_SIZE, fetcher=fetch_url,
+                 limiter=None, metrics=None):
+        self.parse = parse
+        self.fetchers = fetchers
+        self.parsers = parsers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.metrics = metrics
+        if metrics is not None:
+            fetcher = metrics.wrap_fetcher(fetcher)
+            for name in ("urls", "pages", "parsing", "results"):
+                metrics.gauge(name, lambda name=name:
+                              self.queue_depths()[name])
+        self.fetcher = fetcher
+        self.limiter = limiter or HostLimiter(per_host, delay)
+        self.fetched = 0
+        self.submitted = 0
+        self.parsed = 0
+        self._count_lock = threading.Lock()
+
+    def queue_depths(self):
+        '''How many URLs, pages and results are waiting right now.'''
+        return {"urls": self._urls.qsize(), "pages": self._pages.qsize(),
+                "parsing": self.submitted - self.parsed,
+                "results": self._results.qsize()}
+
+    def _put(self, q, item):
+        # a put that gives up when the pipeline is stopped early
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, q):
+        # a get that returns _DONE when the pipeline is stopped early
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def _acquire(self):
+        while not self._stop.is_set():
+            if self._slots.acquire(timeout=0.1):
+                return True
+        return False
+
+    def _feed(self, urls):
+        try:
+            for url in urls:
+                if not self._put(self._urls, url):
+                    return
+        except Exception as e:
+            # e.g. a generator of URLs that failed; run() raises it
+            self._results.put(_StageError(e))
+        finally:
+            # without these the fetchers, and everything after them, would
+            # wait for more URLs forever
+            for _ in range(self.fetchers):
+                self._put(self._urls, _DONE)
+
+    def _fetch(self):
+        while True:
+            url = self._get(self._urls)
+            if url is _DONE:
+                self._put(self._pages, _DONE)
+                return
+            try:
+                with self.limiter.slot(host_of(url)):
+                    page = self.fetcher(url)
+            except Exception as e:
+                # fetch errors skip the parsers and go straight to the results
+                if self._acquire():
+                    self._results.put((url, e))
+                continue
+            with self._count_lock:
+                self.fetched += 1
+            if not self._put(self._pages, page):
+                return
+
+    def _dispatch(self, pool):
+        try:
+            self._submit_pages(pool)
+        except Exception as e:
+            # e.g. BrokenProcessPool after a parser process died; the pages
+            # still coming could not be parsed, so run() raises it
+            self._results.put(_StageError(e))
+
+    def _submit_pages(self, pool):
+        finished = 0
+        while finished < self.fetchers:
+            page = self._get(self._pages)
+            if self._stop.is_set():
+                return
+            if page is _DONE:
+                finished += 1
+                continue
+            # at most `queue_size` pages are parsed or waiting to be written
+            if not self._acquire():
+                return
+            self.submitted += 1
+            future = pool.submit(_parse_page, self.parse, page)
+            future.add_done_callback(
+                lambda f, url=page.url: self._parsed(url, f))
+
+    def _parsed(self, url, future):
+        try:
+            result, error, seconds = future.result()
+        except Exception as e:
+            # the worker process died or the page could not be sent to it
+            result, error, seconds = None, e, None
+        if error is not None:
+            result = error
+        if self.metrics is not None and seconds is not None:
+            self.metrics.record_parse(seconds, error)
+        self.parsed += 1
+        # never blocks: the semaphore keeps the results queue short
+        self._results.put((url, result))
+
+    def run(self, urls):
+        '''
+        Yields (url, result) pairs as the pages are parsed, in the order they
+        finish (not the order of `urls`). Exceptions raised while fetching
+        or parsing take the place of the result. `urls` can be any iterable,
+        including a generator that is still discovering URLs; if iterating
+        over it raises an exception, run() raises it too. So it does when a
+        parser process dies (BrokenProcessPool), after the results that were
+        ready.
+        '''
+        self._urls = queue.Queue(self.queue_size)
+        self._pages = queue.Queue(self.queue_size)
+        self._results = queue.Queue()
+        self._slots = threading.Semaphore(self.queue_size)
+        self._stop = threading.Event()
+
+        threads = [threading.Thread(target=self._feed, args=(urls,))]
+        threads += [threading.Thread(target=self._fetch)
+                    for _ in range(self.fetchers)]
+
+        pool = ProcessPoolExecutor(self.parsers)
+
+        def dispatch():
+            try:
+                self._dispatch(pool)
+            finally:
+                # waits for the running parses, whose callbacks then have
+                # put their results in the queue
+                pool.shutdown(wait=True)
+                self._results.put(_DONE)
+
+        threads.append(threading.Thread(target=dispatch))
+        for t in threads:
+            t.daemon = True
+            t.start()
+        try:
+            while True:
+                item = self._results.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, _StageError):
+                    raise item.error
+                self._slots.release()
+                yield item
+        finally:
+            # also reached when the caller stops iterating early
+            self._stop.set()
+            for t in threads:
+                t.join()
+
+
+def pipeline(urls, parse, fetchers=16, parsers=None, per_host=2, delay=0.0,
+             queue_size=QUEUE_SIZE, fetcher=fetch_url, limiter=None,
+             metrics=None):
+    '''
+    Shortcut for Pipeline(parse, ...).run(urls): yields (url, result) pairs
+    as they are ready.
+
+        with open("births.csv", "w") as f:
+            for url, birth in pipeline(new_links, get_birth):
+                f.write("%s,%s\\n" % (url, birth))
+    '''
+    return Pipeline(parse, fetchers, parsers, per_host, delay, queue_size,
+                    fetcher, limiter, metrics).run(urls)
@@ -0,0 +1,190 @@
+# coding: utf-8
+
+'''
+Follow robots.txt and crawl politely across many hosts.
+
+The scraping lecture asks you to read robots.txt by hand. RobotsCache fetches
+each host's robots.txt once, answers "may I fetch this URL?" and reports the
+host's `Crawl-delay`. PoliteScheduler uses it to crawl a list of URLs: every
+host gets at most `per_host` requests at a time, spaced by its crawl delay,
+and the workers always pick the host that is ready soonest. One slow host
+then only slows down its own pages, and the total number of pages per second
+grows with the number of different hosts in the list.
+'''
+
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+from crawler.fetch import USER_AGENT, fetch_url, host_of
+
+
+class RobotsDisallowed(Exception):
+    '''Put in the results for URLs that robots.txt does not allow.'''
+
+
+class RobotsCache(object):
+    '''
+    robots.txt rules per host, fetched on first use and kept for `ttl`
+    seconds. A missing robots.txt (404) allows everything; one that cannot
+    be fetched (server error, no connection) disallows the host for now,
+    as the robots.txt standard recommends.
+    '''
+    def __init__(self, user_agent=USER_AGENT, fetcher=fetch_url,
+                 ttl=24 * 3600):
+        self.user_agent = user_agent
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self._rules = {}
+        self._lock = threading.Lock()
+
+    def _load(self, scheme, host):
+        parser = RobotFileParser()
+        try:
+            page = self.fetcher("%s://%s/robots.txt" % (scheme, host))
+        except Exception:
+            parser.disallow_all = True
+            return parser
+        if page.status == 200:
+            parser.parse(page.body.decode("utf-8", "replace").splitlines())
+        elif 400 <= page.status < 500:
+            parser.allow_all = True
+        else:
+            parser.disallow_all = True
+        return parser
+
+    def rules(self, url):
+        parts = urlsplit(url)
+        host = parts.netloc.lower()
+        with self._lock:
+            entry = self._rules.get(host)
+        if entry is None or time.time() - entry[1] > self.ttl:
+            entry = (self._load(parts.scheme or "http", host), time.time())
+            with self._lock:
+                self._rules[host] = entry
+        return entry[0]
+
+    def allowed(self, url):
+        return self.rules(url).can_fetch(self.user_agent, url)
+
+    def crawl_delay(self, url):
+        '''The host's Crawl-delay (or Request-rate) in seconds, or None.'''
+        rules = self.rules(url)
+        delay = rules.crawl_delay(self.user_agent)
+        rate = rules.request_rate(self.user_agent)
+        if rate is not None and rate.requests:
+            rate_delay = rate.seconds / float(rate.requests)
+            delay = max(delay or 0, rate_delay)
+        return float(delay) if delay is not None else None
+
+
+class PoliteScheduler(object):
+    '''
+    Crawls URLs from many hosts at once while each host sees a compliant
+    rate: at most `per_host` requests in flight and at least the host's
+    crawl delay (or `default_delay`) between request starts.
+    '''
+    def __init__(self, robots=None, per_host=1, default_delay=1.0,
+                 max_workers=16, fetcher=fetch_url):
+        self.robots = robots or RobotsCache(fetcher=fetcher)
+        self.per_host = per_host
+        self.default_delay = default_delay
+        self.max_workers = max_workers
+        self.fetcher = fetcher
+        self._cond = threading.Condition()
+        # kept between crawl() calls, so a host's crawl delay also holds
+        # from one call to the next
+        self._next = collections.defaultdict(float)
+        self._delays = {}
+
+    def limit_for(self, host):
+        return self.per_host
+
+    def delay_for(self, host):
+        return self._delays.get(host, self.default_delay)
+
+    def _next_task(self):
+        # pick the host that may start a request soonest
+        with self._cond:
+            while True:
+                best = None
+                for host, queue in self._queues.items():
+                    if not queue or \
+                            self._active[host] >= self.limit_for(host):
+                        continue
+                    if best is None or self._next[host] < self._next[best]:
+                        best = host
+                if best is None:
+                    if not any(self._queues.values()):
+                        return None
+                    self._cond.wait()
+                    continue
+                wait = self._next[best] - time.time()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                self._active[best] += 1
+                self._next[best] = time.time() + self.delay_for(best)
+                return best, self._queues[best].popleft()
+
+    def _task_done(self, host):
+        with self._cond:
+            self._active[host] -= 1
+            self._cond.notify_all()
+
+    def _work(self, parse, results):
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            host, (i, url) = task
+            try:
+                page = self.fetcher(url)
+            except Exception as e:
+                results[i] = e
+                continue
+            finally:
+                self._task_done(host)
+            try:
+                results[i] = parse(page) if parse is not None else page
+            except Exception as e:
+                results[i] = e
+
+    def crawl(self, urls, parse=None):
+        '''
+        Fetches `urls` and returns one result per URL in input order, like
+        crawl() in crawler.fetch. URLs disallowed by robots.txt get a
+        RobotsDisallowed exception as their result.
+        '''
+        urls = list(urls)
+        results = [None] * len(urls)
+        self._queues = collections.OrderedDict()
+        self._active = collections.defaultdict(int)
+
+        # fetch robots.txt for every host first, one request per host
+        first = collections.OrderedDict()
+        for url in urls:
+            first.setdefault(host_of(url), url)
+        with ThreadPoolExecutor(self.max_workers) as pool:
+            delays = list(pool.map(self.robots.crawl_delay, first.values()))
+        for host, delay in zip(first, delays):
+            if delay is not None:
+                self._delays[host] = max(delay, self.default_delay)
+
+        for i, url in enumerate(urls):
+            if not self.robots.allowed(url):
+                results[i] = RobotsDisallowed(url)
+                continue
+            self._queues.setdefault(host_of(url), collections.deque()).append(
+                (i, url))
+
+        threads = [threading.Thread(target=self._work, args=(parse, results))
+                   for _ in range(self.max_workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
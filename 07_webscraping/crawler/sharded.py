@@ -0,0 +1,202 @@
+# coding: utf-8
+
+'''
+Crawl with several processes, each in charge of its own hosts.
+
+One process can only parse as fast as one CPU core. ShardedCrawler starts
+`workers` processes and gives each host to exactly one of them, picked by a
+hash of the host name. Every worker runs its own PoliteScheduler, and since
+no other worker ever sees its hosts, the per-host limits and crawl delays
+hold for the whole crawl, not just for one process. The flip side is that
+all pages of one host go to one worker: sharding only spreads the work when
+the crawl covers many hosts.
+
+The main process is the coordinator: it takes URLs from a Frontier, sends
+each one to the worker that owns its host, and adds the links the workers
+report back to the Frontier -- where they are de-duplicated before being
+sent out again.
+
+    frontier = Frontier("crawl.db")
+    crawler = ShardedCrawler(frontier, get_birth, workers=4, max_depth=2)
+    for url, depth, result in crawler.run(seeds):
+        ...
+
+`parse` and `links` run in the workers: they must be functions defined at
+the top level of a module (not a lambda), and return picklable values.
+'''
+
+import hashlib
+import multiprocessing
+import pickle
+import queue
+
+from crawler.fetch import fetch_url, host_of
+from crawler.links import page_links
+from crawler.robots import PoliteScheduler
+
+# URLs sent to a worker at a time
+BATCH_SIZE = 50
+
+# how often the coordinator checks that its workers are alive while it waits
+POLL_SECONDS = 1.0
+
+
+class WorkerError(Exception):
+    '''
+    Takes the place of the result when fetching or parsing a URL failed in
+    a worker. `kind` is the name of the original exception class.
+    '''
+    def __init__(self, kind, message):
+        # both go to Exception so that `args` has them: unpickling in the
+        # main process calls WorkerError(*args)
+        Exception.__init__(self, kind, message)
+        self.kind = kind
+        self.message = message
+
+    def __str__(self):
+        return "%s: %s" % (self.kind, self.message)
+
+
+def shard_of(url, shards):
+    '''Which of `shards` workers owns the host of `url`.'''
+    digest = hashlib.blake2b(host_of(url).encode("utf-8"),
+                             digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+
+def _worker(inbox, outbox, parse, links, per_host, default_delay, threads):
+    scheduler = PoliteScheduler(per_host=per_host,
+                                default_delay=default_delay,
+                                max_workers=threads, fetcher=fetch_url)
+
+    def parse_and_link(page):
+        result = parse(page) if parse is not None else None
+        return result, links(page) if links is not None else []
+
+    while True:
+        batch = inbox.get()
+        if batch is None:
+            return
+        # take whatever else is waiting too, so hosts in different batches
+        # are crawled side by side
+        while True:
+            try:
+                more = inbox.get_nowait()
+            except queue.Empty:
+                break
+            if more is None:
+                inbox.put(None)
+                break
+            batch.extend(more)
+        results = scheduler.crawl([url for url, depth in batch],
+                                  parse_and_link)
+        for (url, depth), outcome in zip(batch, results):
+            if not isinstance(outcome, Exception):
+                # the queue pickles in a background thread, which only logs
+                # an error and drops the item; the coordinator would then
+                # wait for it forever
+                try:
+                    pickle.dumps(outcome)
+                except Exception as e:
+                    outcome = e
+            if isinstance(outcome, Exception):
+                outbox.put((url, depth, WorkerError(type(outcome).__name__,
+                                                    str(outcome)), []))
+            else:
+                outbox.put((url, depth, outcome[0], outcome[1]))
+
+
+class ShardedCrawler(object):
+    '''
+    Crawls the URLs in `frontier` with `workers` processes of `threads`
+    threads each. `parse(page)` gives each page's result; `links(page)`
+    the links to follow (default: every link on the page). Links are only
+    followed up to `max_depth` (None: no limit).
+    '''
+    def __init__(self, frontier, parse=None, links=page_links, workers=None,
+                 threads=16, per_host=1, default_delay=1.0, max_depth=None,
+                 batch_size=BATCH_SIZE):
+        self.frontier = frontier
+        self.parse = parse
+        self.links = links
+        self.workers = workers or multiprocessing.cpu_count()
+        self.threads = threads
+        self.per_host = per_host
+        self.default_delay = default_delay
+        self.max_depth = max_depth
+        self.batch_size = batch_size
+
+    def _next_result(self, outbox, processes):
+        # a dead worker never sends the results it owes
+        while True:
+            try:
+                return outbox.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                pass
+            for p in processes:
+                if not p.is_alive():
+                    raise RuntimeError("worker process %d died (exit code "
+                                       "%s)" % (p.pid, p.exitcode))
+
+    def run(self, seeds=(), max_pages=None):
+        '''
+        Adds `seeds` to the frontier and crawls until the frontier is empty
+        or `max_pages` pages are done. Yields (url, depth, result) as pages
+        finish; failed pages, and results that cannot be pickled, have a
+        WorkerError as their result. Raises RuntimeError if a worker process
+        dies.
+        '''
+        self.frontier.add_many(seeds)
+        inboxes = [multiprocessing.Queue() for _ in range(self.workers)]
+        outbox = multiprocessing.Queue()
+        processes = [multiprocessing.Process(
+            target=_worker, args=(inbox, outbox, self.parse, self.links,
+                                  self.per_host, self.default_delay,
+                                  self.threads))
+            for inbox in inboxes]
+        for p in processes:
+            p.daemon = True
+            p.start()
+
+        # keep enough URLs out to keep every worker busy, but not the
+        # whole frontier
+        window = self.workers * self.batch_size * 2
+        sent = 0
+        in_flight = 0
+        try:
+            while True:
+                # top up once there is room for at least a batch
+                room = window - in_flight
+                if (room >= self.batch_size or in_flight == 0) and \
+                        (max_pages is None or sent < max_pages):
+                    n = room
+                    if max_pages is not None:
+                        n = min(n, max_pages - sent)
+                    batch = self.frontier.pop(n)
+                    shards = [[] for _ in range(self.workers)]
+                    for url, depth in batch:
+                        shards[shard_of(url, self.workers)].append(
+                            (url, depth))
+                    for inbox, urls in zip(inboxes, shards):
+                        for i in range(0, len(urls), self.batch_size):
+                            inbox.put(urls[i:i + self.batch_size])
+                    sent += len(batch)
+                    in_flight += len(batch)
+                if in_flight == 0:
+                    return
+                url, depth, result, found = self._next_result(outbox,
+                                                              processes)
+                in_flight -= 1
+                if found and (self.max_depth is None or
+                              depth < self.max_depth):
+                    self.frontier.add_many(found, depth + 1)
+                self.frontier.done(url, "error" if isinstance(
+                    result, WorkerError) else "done")
+                yield url, depth, result
+        finally:
+            for inbox in inboxes:
+                inbox.put(None)
+            for p in processes:
+                p.join(5)
+                if p.is_alive():
+                    p.terminate()
@@ -0,0 +1,153 @@
+# coding: utf-8
+
+'''
+Spot pages that are almost the same as one already crawled.
+
+Mirrors, print versions and redirect variants of a page differ in a few
+bytes (a date, a menu, a tracking parameter), so an exact hash like the one
+in crawler.changes treats them as new pages and they get parsed and stored
+again. A SimHash is a 64-bit fingerprint of a page's text that changes only
+a little when the text changes a little: two pages are near-duplicates when
+their fingerprints differ in at most a few bits.
+
+SimHashIndex finds such a fingerprint among millions without comparing them
+all. It cuts each fingerprint into `distance + 1` bands; if two fingerprints
+differ in at most `distance` bits, at least one band must be identical, so
+only fingerprints sharing a band need to be compared.
+'''
+
+import collections
+import hashlib
+import re
+import threading
+from html import unescape
+
+from crawler.changes import main_content
+
+BITS = 64
+
+TAGS = re.compile(rb"<(script|style)\b.*?</\1\s*>|<!--.*?-->|<[^>]*>",
+                  re.S | re.I)
+WORDS = re.compile(r"\w+", re.U)
+
+# what a parse function wrapped by skip_near_duplicates() returns for a page
+# that looks like `original`, a page seen before
+NearDuplicate = collections.namedtuple("NearDuplicate",
+                                       ["url", "original", "distance"])
+
+
+def page_text(body):
+    '''The visible text of a page's main content, lower-cased.'''
+    text = TAGS.sub(b" ", main_content(body)).decode("utf-8", "replace")
+    return unescape(text).lower()
+
+
+def simhash(text, shingle=3):
+    '''
+    The 64-bit SimHash of `text`: every run of `shingle` words votes on each
+    bit with its own hash; a bit is set when most runs have it set.
+    '''
+    words = WORDS.findall(text)
+    if len(words) < shingle:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + shingle])
+                    for i in range(len(words) - shingle + 1)]
+    bits = ["{:064b}".format(int.from_bytes(
+        hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big"))
+        for s in shingles]
+    # count the votes one bit position at a time; zip(*bits) gives the
+    # columns of the table of bit strings
+    half = len(bits) / 2.0
+    fingerprint = 0
+    for column in zip(*bits):
+        fingerprint <<= 1
+        if column.count("1") > half:
+            fingerprint |= 1
+    return fingerprint
+
+
+def page_simhash(body, shingle=3):
+    return simhash(page_text(body), shingle)
+
+
+def hamming(a, b):
+    '''Number of bits in which two fingerprints differ.'''
+    return bin(a ^ b).count("1")
+
+
+class SimHashIndex(object):
+    '''
+    Fingerprints of the pages seen so far, by key (e.g. the URL). near()
+    finds a stored fingerprint at most `distance` bits away.
+    '''
+    def __init__(self, distance=4):
+        self.distance = distance
+        self.bands = distance + 1
+        # split the 64 bits into `bands` runs of nearly equal width
+        edges = [BITS * i // self.bands for i in range(self.bands + 1)]
+        self._masks = [(edges[i], (1 << (edges[i + 1] - edges[i])) - 1)
+                       for i in range(self.bands)]
+        self._tables = [collections.defaultdict(list)
+                        for _ in range(self.bands)]
+        self._lock = threading.Lock()
+        self.size = 0
+
+    def _band_values(self, fingerprint):
+        return [(fingerprint >> shift) & mask for shift, mask in self._masks]
+
+    def _add(self, key, fingerprint):
+        for table, value in zip(self._tables, self._band_values(fingerprint)):
+            table[value].append((fingerprint, key))
+        self.size += 1
+
+    def _near(self, fingerprint):
+        # only fingerprints that share a band with this one can be close
+        best = None
+        for table, value in zip(self._tables, self._band_values(fingerprint)):
+            for other, key in table.get(value, ()):
+                d = hamming(fingerprint, other)
+                if d <= self.distance and (best is None or d < best[1]):
+                    best = (key, d)
+        return best
+
+    def add(self, key, fingerprint):
+        with self._lock:
+            self._add(key, fingerprint)
+
+    def near(self, fingerprint):
+        '''
+        Returns (key, distance) of the closest stored fingerprint within
+        `distance` bits, or None.
+        '''
+        with self._lock:
+            return self._near(fingerprint)
+
+    def check(self, key, fingerprint):
+        '''
+        Returns (key, distance) of a near-duplicate if there is one;
+        otherwise stores the fingerprint under `key` and returns None.
+        '''
+        with self._lock:
+            found = self._near(fingerprint)
+            if found is None:
+                self._add(key, fingerprint)
+        return found
+
+    def __len__(self):
+        return self.size
+
+
+def skip_near_duplicates(index, parse, shingle=3):
+    '''
+    Wraps a crawl() parse function so it does not run for pages that are
+    near-duplicates of a page seen before; those get a NearDuplicate as
+    their result instead. The index lives in this process, so use it with
+    crawl() rather than pipeline(), whose parsers run in other processes.
+    '''
+    def parse_if_new(page):
+        found = index.check(page.url, page_simhash(page.body, shingle))
+        if found is not None:
+            return NearDuplicate(page.url, found[0], found[1])
+        return parse(page)
+    return parse_if_new
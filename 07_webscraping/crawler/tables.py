@@ -0,0 +1,156 @@
+# coding: utf-8
+
+'''
+Read a whole wikitable in one pass.
+
+The link loop in the crawling lecture calls `wiki_table.find_all('tr')[i+1]`
+for every row, which searches the whole table again each time: twice as many
+rows means four times the work. extract_table() walks the rows once and
+collects each cell's text together with the href and title of its first
+link, ready to become a pandas DataFrame or an Arrow table.
+
+Wikitables often share one cell between several rows -- the Turing Award
+table has a single Year cell when a year has several winners -- or columns.
+Such cells are copied into every row and column they cover, so each value
+ends up under the right column.
+'''
+
+from collections import namedtuple
+
+# one table cell: its text plus the href and title of its first link
+Cell = namedtuple("Cell", ["text", "href", "title", "header"])
+
+# stands in for a grid position that no cell covers
+EMPTY = Cell("", None, None, False)
+
+
+def find_wikitable(soup, class_="wikitable"):
+    '''The first <table> whose class list contains `class_`.'''
+    return soup.find("table", class_=class_)
+
+
+def _cell(tag):
+    link = tag.find("a", href=True)
+    return Cell(tag.get_text(" ", strip=True),
+                link.get("href") if link is not None else None,
+                link.get("title") if link is not None else None,
+                tag.name == "th")
+
+
+def _span(tag, name):
+    # rowspan/colspan, with anything missing or odd counting as 1
+    try:
+        return max(1, int(tag.get(name, 1)))
+    except (TypeError, ValueError):
+        return 1
+
+
+def iter_rows(table, spans=True):
+    '''
+    Yields each row of `table` as a list of Cells. Rows of tables nested
+    inside a cell are skipped. Every row and cell is visited once.
+
+    With `spans`, a cell with a rowspan or colspan appears in every row and
+    column it covers, so position i of each list is column i of the table.
+    '''
+    # column -> [cell, rows it still covers], for cells from rows above
+    carried = {}
+
+    def take(col, out):
+        if col in carried:
+            out.append(carried[col][0])
+            carried[col][1] -= 1
+            if carried[col][1] == 0:
+                del carried[col]
+        else:
+            out.append(EMPTY)
+
+    for row in table.find_all("tr"):
+        if row.find_parent("table") is not table:
+            continue
+        tags = row.find_all(["th", "td"], recursive=False)
+        if not spans:
+            yield [_cell(tag) for tag in tags]
+            continue
+        out = []
+        for tag in tags:
+            # cells carried down from above come before this one
+            while len(out) in carried:
+                take(len(out), out)
+            cell = _cell(tag)
+            rows = _span(tag, "rowspan")
+            for _ in range(_span(tag, "colspan")):
+                if rows > 1:
+                    carried[len(out)] = [cell, rows - 1]
+                out.append(cell)
+        # and those to the right of the last cell
+        while carried and len(out) <= max(carried):
+            take(len(out), out)
+        yield out
+
+
+def extract_table(table, links=True):
+    '''
+    Returns (columns, records) for a wikitable. Column names come from the
+    first row made only of <th> cells; the other rows become dicts. With
+    `links`, every column that contains links gets two extra columns,
+    "<column>_href" and "<column>_title".
+    '''
+    columns = None
+    rows = []
+    for cells in iter_rows(table):
+        if not cells:
+            continue
+        if columns is None and all(c.header for c in cells):
+            columns = [c.text for c in cells]
+            continue
+        rows.append(cells)
+
+    width = max([len(columns or [])] + [len(r) for r in rows])
+    if columns is None:
+        columns = []
+    # unnamed or missing header cells get their position as name
+    named = []
+    for i, c in enumerate(columns + [""] * (width - len(columns))):
+        name = c or "column_%d" % i
+        if name in named:
+            name = "%s_%d" % (name, i)
+        named.append(name)
+    columns = named
+
+    linked = set()
+    if links:
+        for cells in rows:
+            for i, c in enumerate(cells):
+                if c.href is not None:
+                    linked.add(i)
+
+    names = list(columns)
+    for i in sorted(linked):
+        names += [columns[i] + "_href", columns[i] + "_title"]
+
+    records = []
+    for cells in rows:
+        record = dict((name, None) for name in names)
+        for i, c in enumerate(cells):
+            record[columns[i]] = c.text
+            if i in linked:
+                record[columns[i] + "_href"] = c.href
+                record[columns[i] + "_title"] = c.title
+        records.append(record)
+    return names, records
+
+
+def table_to_dataframe(table, links=True):
+    '''extract_table() as a pandas DataFrame.'''
+    import pandas as pd
+    columns, records = extract_table(table, links)
+    return pd.DataFrame.from_records(records, columns=columns)
+
+
+def table_to_arrow(table, links=True):
+    '''extract_table() as a pyarrow Table with string columns.'''
+    import pyarrow
+    columns, records = extract_table(table, links)
+    return pyarrow.table(dict((name, [r[name] for r in records])
+                              for name in columns))
@@ -0,0 +1,41 @@
+# coding: utf-8
+
+from crawler.frontier import Frontier, normalize_url
+
+
+def test_reserved_escapes_keep_their_meaning():
+    assert normalize_url("http://ex.com/?q=a%26b&c=1") == \
+        "http://ex.com/?q=a%26b&c=1"
+    assert normalize_url("http://ex.com/?q=a%3db") == "http://ex.com/?q=a%3Db"
+    assert normalize_url("http://ex.com/a%2fb") == "http://ex.com/a%2Fb"
+
+
+def test_unreserved_escapes_are_decoded():
+    assert normalize_url("http://EX.com:80/%7e%41/b/../c#top") == \
+        "http://ex.com/~A/c"
+    assert normalize_url("http://ex.com/%c3%a9") == \
+        normalize_url("http://ex.com/é")
+
+
+def test_relative_links_and_other_schemes():
+    base = "https://en.wikipedia.org/wiki/Turing_Award"
+    assert normalize_url("/wiki/Alan_Perlis#Career", base) == \
+        "https://en.wikipedia.org/wiki/Alan_Perlis"
+    assert normalize_url("mailto:someone@example.org") is None
+
+
+def test_urls_are_added_once(tmp_path):
+    path = str(tmp_path / "frontier.db")
+    frontier = Frontier(path)
+    # a repeat inside one call and one from an earlier call
+    assert frontier.add_many(["http://a/1", "http://a/1", "http://a/2"]) == 2
+    assert frontier.add_many(["http://A/1", "http://a/3"]) == 1
+    frontier.close()
+
+    # after a restart the seen-set is still there
+    frontier = Frontier(path)
+    assert frontier.add_many(["http://a/1", "http://a/4"]) == 1
+    assert "http://a/4" in frontier
+    assert "http://a/5" not in frontier
+    assert len(frontier) == 4
+    frontier.close()
@@ -0,0 +1,41 @@
+# coding: utf-8
+
+from crawler.links import MAX_TAG, LinkScanner, iter_links
+
+BASE = "https://en.wikipedia.org/wiki/Turing_Award"
+
+
+def people(n):
+    return "".join('<p>x</p><a href="/wiki/P%d">p</a>' % i for i in range(n))
+
+
+def test_links_across_chunk_boundaries():
+    html = '<!-- <a href="/wiki/No"> --><a title="a > b" href="/wiki/A">' \
+           '<script>"<a href=/wiki/No>"</script><base href="/other/">' + \
+           '<a href="B">'
+    chunks = [html[i:i + 5] for i in range(0, len(html), 5)]
+    assert list(iter_links(chunks, BASE)) == [
+        "https://en.wikipedia.org/wiki/A", "https://en.wikipedia.org/other/B"]
+
+
+def test_stray_quote_does_not_stall_the_scanner():
+    html = "<a title=it's href=\"/wiki/A\">A</a>" + people(2000)
+    scanner = LinkScanner(BASE)
+    first = None
+    longest = 0
+    for i in range(0, len(html), 1024):
+        scanner.feed(html[i:i + 1024])
+        longest = max(longest, len(scanner._buffer))
+        if first is None and scanner.pop():
+            first = i
+    scanner.close()
+    # the links keep coming while the page arrives, in bounded memory
+    assert first is not None and first < MAX_TAG + 1024
+    assert longest <= MAX_TAG + 1024
+
+
+def test_stray_quote_keeps_the_href():
+    links = list(iter_links(["<a title=it's href=\"/wiki/A\">A</a>" +
+                             people(3)], BASE))
+    assert links[0] == "https://en.wikipedia.org/wiki/A"
+    assert len(links) == 4
@@ -0,0 +1,47 @@
+# coding: utf-8
+
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from crawler.fixtures import FixtureSite
+from crawler.pipeline import pipeline
+
+
+def page_number(page):
+    # top level so the parser processes can use it
+    return int(page.url.rsplit("_", 1)[1])
+
+
+def die_on_page_7(page):
+    if page_number(page) == 7:
+        os._exit(1)
+    return page_number(page)
+
+
+@pytest.fixture
+def site():
+    site = FixtureSite(pages=40).start()
+    yield site
+    site.stop()
+
+
+def test_every_page_is_parsed(site):
+    results = dict(pipeline(site.people(), page_number, fetchers=4,
+                            parsers=2))
+    assert sorted(results.values()) == list(range(40))
+
+
+def test_failing_url_iterable_is_raised(site):
+    def urls():
+        yield site.url("/wiki/Person_1")
+        raise RuntimeError("no more URLs")
+    with pytest.raises(RuntimeError):
+        list(pipeline(urls(), page_number, fetchers=2, parsers=1))
+
+
+def test_dead_parser_process_is_raised(site):
+    # the pages that were not parsed must not be dropped silently
+    with pytest.raises(BrokenProcessPool):
+        list(pipeline(site.people(), die_on_page_7, fetchers=4, parsers=2))
@@ -0,0 +1,87 @@
+# coding: utf-8
+
+import multiprocessing
+import os
+import tempfile
+import threading
+
+import pytest
+
+from crawler.fixtures import FixtureSite
+from crawler.frontier import Frontier
+from crawler.sharded import ShardedCrawler, WorkerError
+
+
+def fail_on_odd_pages(page):
+    # top level so the worker processes can use it
+    if int(page.url.rsplit("_", 1)[1]) % 2:
+        raise ValueError("odd page")
+    return page.url
+
+
+def test_worker_error_crosses_a_queue():
+    q = multiprocessing.Queue()
+    q.put(WorkerError("URLError", "no such host"))
+    error = q.get(timeout=10)
+    assert isinstance(error, WorkerError)
+    assert error.kind == "URLError"
+    assert error.message == "no such host"
+    assert str(error) == "URLError: no such host"
+
+
+def test_failed_pages_do_not_stop_the_crawl():
+    site = FixtureSite(pages=6, crawl_delay=0).start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            frontier = Frontier(os.path.join(tmp, "frontier.db"))
+            crawler = ShardedCrawler(frontier, fail_on_odd_pages, links=None,
+                                     workers=2, default_delay=0)
+            results = dict((url, result) for url, depth, result in
+                           crawler.run(site.people()))
+            frontier.close()
+    finally:
+        site.stop()
+    assert len(results) == 6
+    errors = [r for r in results.values() if isinstance(r, WorkerError)]
+    assert len(errors) == 3
+    assert all(e.kind == "ValueError" for e in errors)
+
+
+def return_a_lock(page):
+    return threading.Lock()
+
+
+def exit_on_page_3(page):
+    if page.url.endswith("_3"):
+        os._exit(1)
+    return page.url
+
+
+def test_unpicklable_result_becomes_an_error():
+    site = FixtureSite(pages=3, crawl_delay=0).start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            frontier = Frontier(os.path.join(tmp, "frontier.db"))
+            crawler = ShardedCrawler(frontier, return_a_lock, links=None,
+                                     workers=2, default_delay=0)
+            results = [result for url, depth, result in
+                       crawler.run(site.people())]
+            frontier.close()
+    finally:
+        site.stop()
+    assert len(results) == 3
+    assert all(isinstance(r, WorkerError) for r in results)
+
+
+def test_dead_worker_is_raised():
+    site = FixtureSite(pages=6, crawl_delay=0).start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            frontier = Frontier(os.path.join(tmp, "frontier.db"))
+            crawler = ShardedCrawler(frontier, exit_on_page_3, links=None,
+                                     workers=2, default_delay=0)
+            with pytest.raises(RuntimeError):
+                list(crawler.run(site.people()))
+            frontier.close()
+    finally:
+        site.stop()
@@ -0,0 +1,42 @@
+# coding: utf-8
+
+from bs4 import BeautifulSoup
+
+from crawler.infobox import PARSER
+from crawler.tables import extract_table, iter_rows
+
+WINNERS = '''
+<table class="wikitable">
+<tr><th>Year</th><th>Recipient</th><th>Rationale</th></tr>
+<tr><td rowspan="2">1975</td>
+    <td><a href="/wiki/Allen_Newell" title="Allen Newell">Allen Newell</a></td>
+    <td rowspan="2">AI</td></tr>
+<tr><td><a href="/wiki/Herbert_A._Simon" title="Herbert A. Simon">Herbert
+    A. Simon</a></td></tr>
+<tr><td>1976</td><td colspan="2"><a href="/wiki/Michael_O._Rabin">Michael
+    O. Rabin</a></td></tr>
+</table>'''
+
+
+def table():
+    return BeautifulSoup(WINNERS, PARSER).find("table")
+
+
+def test_rowspan_cells_are_carried_down():
+    columns, records = extract_table(table())
+    assert [r["Year"] for r in records] == ["1975", "1975", "1976"]
+    assert [r["Recipient_href"] for r in records] == [
+        "/wiki/Allen_Newell", "/wiki/Herbert_A._Simon",
+        "/wiki/Michael_O._Rabin"]
+    assert records[1]["Rationale"] == "AI"
+
+
+def test_colspan_cells_fill_every_column():
+    rows = list(iter_rows(table()))
+    assert [len(r) for r in rows] == [3, 3, 3, 3]
+    assert rows[3][1] is rows[3][2]
+
+
+def test_spans_can_be_left_alone():
+    rows = list(iter_rows(table(), spans=False))
+    assert [len(r) for r in rows] == [3, 3, 1, 2]
@@ -0,0 +1,189 @@
+# coding: utf-8
+
+'''
+Save crawled pages as WARC files and re-run extraction offline.
+
+Every change to the `vcard` or `wikitable` code used to mean crawling all the
+pages again. WARCWriter stores each response the crawler receives in a WARC
+file (the standard web-archive format, readable by tools like warcio) and
+writes an index with the byte offset of every record. reparse() then runs an
+extraction function over the archived pages in several worker processes,
+without any network access, so trying a new parser is limited only by CPU.
+'''
+
+import gzip
+import io
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from http.client import responses
+
+from crawler.fetch import Page
+
+# start a new WARC file once the current one passes this size
+WARC_BYTES = 1024 * 1024 * 1024
+
+
+def _http_block(page):
+    # rebuild the HTTP response the way it came over the wire
+    reason = responses.get(page.status, "")
+    lines = ["HTTP/1.1 %d %s" % (page.status, reason)]
+    for name, value in page.headers.items():
+        # the body is stored decoded and in full
+        if name in ("transfer-encoding", "content-encoding"):
+            continue
+        if name == "content-length":
+            value = str(len(page.body))
+        lines.append("%s: %s" % (name, value))
+    head = ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+    return head + page.body
+
+
+def _record(page):
+    block = _http_block(page)
+    date = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    header = ("WARC/1.1\r\n"
+              "WARC-Type: response\r\n"
+              "WARC-Record-ID: <urn:uuid:%s>\r\n"
+              "WARC-Date: %s\r\n"
+              "WARC-Target-URI: %s\r\n"
+              "Content-Type: application/http; msgtype=response\r\n"
+              "Content-Length: %d\r\n"
+              "\r\n") % (uuid.uuid4(), date, page.url, len(block))
+    return header.encode("utf-8") + block + b"\r\n\r\n", date
+
+
+class WARCWriter(object):
+    '''
+    Appends pages to `<prefix>-00000.warc.gz`, `<prefix>-00001.warc.gz`...
+    and records every page in `<prefix>.index.jsonl` (url, file, offset,
+    length, status, date). Each record is its own gzip member, so a single
+    page can be read back with one seek.
+    '''
+    def __init__(self, prefix, max_bytes=WARC_BYTES):
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.index_path = prefix + ".index.jsonl"
+        self._lock = threading.Lock()
+        folder = os.path.dirname(prefix)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        self._number = 0
+        while os.path.exists(self._path(self._number + 1)):
+            self._number += 1
+
+    def _path(self, number):
+        return "%s-%05d.warc.gz" % (self.prefix, number)
+
+    def write(self, page):
+        raw, date = _record(page)
+        blob = gzip.compress(raw)
+        with self._lock:
+            path = self._path(self._number)
+            if os.path.exists(path) and \
+                    os.path.getsize(path) + len(blob) > self.max_bytes:
+                self._number += 1
+                path = self._path(self._number)
+            with open(path, "ab") as f:
+                offset = f.tell()
+                f.write(blob)
+            entry = {"url": page.url, "file": os.path.basename(path),
+                     "offset": offset, "length": len(blob),
+                     "status": page.status, "date": date}
+            with open(self.index_path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        return entry
+
+    def wrap(self, fetcher):
+        '''
+        Returns a fetcher that archives every page it fetches; pass it to
+        crawl(), e.g. crawl(urls, parse, fetcher=writer.wrap(fetch_url)).
+        '''
+        def archiving_fetcher(url, **kwargs):
+            page = fetcher(url, **kwargs)
+            if page.status != 304:
+                self.write(page)
+            return page
+        return archiving_fetcher
+
+
+def parse_record(raw):
+    '''Turns the bytes of one WARC response record back into a Page.'''
+    stream = io.BytesIO(raw)
+    warc_headers = {}
+    stream.readline()  # WARC/1.1
+    for line in iter(stream.readline, b"\r\n"):
+        name, _, value = line.decode("utf-8").partition(":")
+        warc_headers[name.strip().lower()] = value.strip()
+    block = stream.read(int(warc_headers["content-length"]))
+    head, _, body = block.partition(b"\r\n\r\n")
+    lines = head.decode("iso-8859-1").split("\r\n")
+    status = int(lines[0].split(" ")[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return Page(warc_headers["warc-target-uri"], status, headers, body, 0.0)
+
+
+def read_index(index_path):
+    '''The index entries written by a WARCWriter, as a list of dicts.'''
+    with open(index_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def read_page(index_path, entry):
+    '''Reads the Page of one index entry.'''
+    folder = os.path.dirname(index_path)
+    with open(os.path.join(folder, entry["file"]), "rb") as f:
+        f.seek(entry["offset"])
+        return parse_record(gzip.decompress(f.read(entry["length"])))
+
+
+def iter_pages(index_path):
+    '''Yields every archived Page in index order.'''
+    for entry in read_index(index_path):
+        yield read_page(index_path, entry)
+
+
+def _reparse_chunk(args):
+    index_path, entries, extract = args
+    out = []
+    folder = os.path.dirname(index_path)
+    handles = {}
+    try:
+        for entry in entries:
+            f = handles.get(entry["file"])
+            if f is None:
+                f = handles[entry["file"]] = open(
+                    os.path.join(folder, entry["file"]), "rb")
+            f.seek(entry["offset"])
+            page = parse_record(gzip.decompress(f.read(entry["length"])))
+            try:
+                out.append((page.url, extract(page)))
+            except Exception as e:
+                out.append((page.url, e))
+    finally:
+        for f in handles.values():
+            f.close()
+    return out
+
+
+def reparse(index_path, extract, processes=None, chunk_size=100):
+    '''
+    Runs `extract(page)` over every page in the archive using `processes`
+    worker processes (default: one per CPU) and returns a list of
+    (url, result) pairs in archive order. `extract` must be a function
+    defined at the top level of a module so it can be sent to the workers.
+    '''
+    entries = read_index(index_path)
+    chunks = [(index_path, entries[i:i + chunk_size], extract)
+              for i in range(0, len(entries), chunk_size)]
+    results = []
+    with ProcessPoolExecutor(processes) as pool:
+        for out in pool.map(_reparse_chunk, chunks):
+            results.extend(out)
+    return results